@@ -0,0 +1,74 @@
+import asyncio
+import json
+import sys
+import time
+from pyppeteer import launch
+from parsel import Selector
+from page_extract import EXTRACT_JS, to_js_spec, extract_from_selector
+import foreignfortune
+import lechocolat
+import traderjoes
+
+# Page url -> field spec to benchmark; pass your own url and site on the command line to override
+DEFAULT_TARGETS = [
+    ("https://foreignfortune.com/collections/men-unisex/products/foreign-fortune-collection-joggers-1", foreignfortune.PRODUCT_FIELDS),
+    ("https://www.lechocolat-alainducasse.com/uk/chocolate-bar", lechocolat.LISTING_FIELDS),
+    ("https://www.traderjoes.com/home/products/category/beverages-182", traderjoes.LISTING_FIELDS),
+]
+SITE_SPECS = {
+    'foreignfortune': foreignfortune.PRODUCT_FIELDS,
+    'lechocolat': lechocolat.PRODUCT_FIELDS,
+    'traderjoes': traderjoes.PRODUCT_FIELDS,
+}
+
+
+# Time `runs` extractions of the same loaded page with both paths and count the bytes each ships
+async def benchmark_page(page, url, spec, runs=10):
+    await page.goto(url, {'waitUntil': 'networkidle2', 'timeout': 60000})
+
+    parsel_times, parsel_bytes = [], 0
+    for _ in range(runs):
+        start = time.perf_counter()
+        content = await page.content()
+        extract_from_selector(Selector(text=content), spec)
+        parsel_times.append(time.perf_counter() - start)
+        parsel_bytes = len(content.encode('utf-8'))
+
+    evaluate_times, evaluate_bytes = [], 0
+    js_spec = to_js_spec(spec)
+    for _ in range(runs):
+        start = time.perf_counter()
+        raw = await page.evaluate(EXTRACT_JS, js_spec)
+        evaluate_times.append(time.perf_counter() - start)
+        evaluate_bytes = len(json.dumps(raw).encode('utf-8'))
+
+    return {
+        'url': url,
+        'runs': runs,
+        'parsel': {'bytes': parsel_bytes, 'median_ms': round(sorted(parsel_times)[runs // 2] * 1000, 2)},
+        'evaluate': {'bytes': evaluate_bytes, 'median_ms': round(sorted(evaluate_times)[runs // 2] * 1000, 2)},
+    }
+
+
+async def main():
+    # Usage: python benchmark_extract.py [url site]
+    if len(sys.argv) == 3:
+        targets = [(sys.argv[1], SITE_SPECS[sys.argv[2]])]
+    else:
+        targets = DEFAULT_TARGETS
+
+    browser = await launch(headless=True, executablePath='/usr/bin/google-chrome')
+    page = await browser.newPage()
+    results = []
+    for url, spec in targets:
+        try:
+            result = await benchmark_page(page, url, spec)
+            results.append(result)
+            print(json.dumps(result, indent=4))
+        except Exception as e:
+            print(f"Failed to benchmark {url}: {str(e)}")
+    await browser.close()
+    return results
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,268 @@
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from fixture_server import start_fixture_server
+
+# Recorded pages of every shop, one directory per site (see readme)
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+RESULTS_DIR = os.path.join('output', 'benchmarks')
+DEFAULT_CONCURRENCY = (1, 2, 4)
+
+# Live origin of each site; its requests are answered from fixtures/<site>/
+ORIGINS = {
+    'foreignfortune': 'https://foreignfortune.com',
+    'lechocolat': 'https://www.lechocolat-alainducasse.com',
+    'traderjoes': 'https://www.traderjoes.com',
+}
+
+
+def routes_for(base_url):
+    return {origin: f"{base_url}/{site}" for site, origin in ORIGINS.items()}
+
+
+# Pid of every process under `pid` (itself included), from the parent pids in /proc
+def process_tree(pid):
+    children = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                parent = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue  # The process exited while we looked
+        children.setdefault(parent, []).append(int(entry))
+    tree, stack = [], [pid]
+    while stack:
+        current = stack.pop()
+        tree.append(current)
+        stack.extend(children.get(current, []))
+    return tree
+
+
+def process_rss(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+# Samples the summed RSS of this process and its children (Chrome and its renderers) and keeps
+# the peak. Shared pages are counted once per process, so this overstates real memory a little.
+# Without /proc only this process's own peak is known.
+class RssSampler:
+    def __init__(self, interval=0.2):
+        self.interval = interval
+        self.peak = 0
+        self.task = None
+
+    def sample(self):
+        if os.path.isdir('/proc'):
+            total = sum(process_rss(pid) for pid in process_tree(os.getpid()))
+        else:
+            import resource
+            total = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        self.peak = max(self.peak, total)
+
+    async def _run(self):
+        while True:
+            self.sample()
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        self.task = asyncio.ensure_future(self._run())
+        return self
+
+    async def stop(self):
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        self.sample()
+
+
+def percentiles(seconds):
+    if not seconds:
+        return {}
+    ordered = sorted(seconds)
+
+    def at(fraction):
+        return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000, 1)
+    return {'count': len(ordered), 'p50': at(0.5), 'p90': at(0.9), 'p99': at(0.99), 'max': round(ordered[-1] * 1000, 1)}
+
+
+# One scraper at one concurrency, inside a child process started in an empty directory, so its
+# output, journal, caches and fingerprints start cold and its module state is fresh
+async def run_site(site, concurrency, base_url):
+    import launcher
+    import run_all
+    from http_client import ORIGIN_ROUTES
+    from rate_limiter import LIMITERS
+    from metrics import METRICS
+
+    ORIGIN_ROUTES.update(routes_for(base_url))
+    adapter = run_all.SITES[site]
+    module = adapter.module
+
+    # The limiter would be what gets measured: let the host go as fast as the tabs allow
+    tabs = concurrency + getattr(module, 'LISTING_CONCURRENCY', 0)
+    LIMITERS.configure(adapter.host, rate=1000.0, burst=1000, max_rate=1000.0,
+                       concurrency=tabs, min_concurrency=tabs, max_concurrency=tabs)
+    adapter.concurrency = concurrency
+    adapter.apply_budget()
+
+    # Time every product the scraper scrapes (carried-forward products never get here)
+    latencies = []
+    scrape_product_details = module.scrape_product_details
+
+    async def timed_scrape(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await scrape_product_details(*args, **kwargs)
+        finally:
+            latencies.append(time.perf_counter() - start)
+    module.scrape_product_details = timed_scrape
+
+    launcher.HEADLESS = True
+    sampler = RssSampler().start()
+    browser = await launcher.launch_browser()
+    try:
+        start = time.perf_counter()
+        products = await adapter.entry(browser, report=False)
+        seconds = time.perf_counter() - start
+    finally:
+        await browser.close()
+    await sampler.stop()
+
+    return {
+        'products': products,
+        'seconds': round(seconds, 2),
+        'products_per_second': round((products or 0) / seconds, 2),
+        'latency_ms': percentiles(latencies),
+        'peak_rss_mb': round(sampler.peak / (1024 * 1024), 1),
+        'reports': adapter.reports(),
+        'stages': METRICS.summary()['sites'].get(site, {}),
+    }
+
+
+# Run one child and add what the fixture server saw: responses (pages, JSON and API calls) and bytes
+def benchmark(server, base_url, site, concurrency):
+    with tempfile.TemporaryDirectory(prefix=f"benchmark-{site}-") as workdir:
+        result_path = os.path.join(workdir, 'result.json')
+        with server.stats_lock:
+            before = dict(server.stats)
+        process = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--child', site, str(concurrency), base_url, result_path],
+            cwd=workdir, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+        with server.stats_lock:
+            served = {key: server.stats[key] - before.get(key, 0) for key in ('responses', 'errors', 'bytes')}
+        if not os.path.exists(result_path):
+            output = process.stdout.strip().splitlines()[-20:]
+            return {'site': site, 'concurrency': concurrency, 'error': f"exit code {process.returncode}", 'output': output}
+        with open(result_path) as f:
+            result = json.load(f)
+
+    pages = served['responses'] - served['errors']
+    return {
+        'site': site,
+        'concurrency': concurrency,
+        **result,
+        'pages': pages,
+        'pages_per_second': round(pages / result['seconds'], 2) if result['seconds'] else None,
+        'failed_requests': served['errors'],
+        'bytes_transferred': served['bytes'],
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+# Print pages/s and median product latency next to an earlier results file
+def compare(previous_path, runs):
+    with open(previous_path) as f:
+        previous = {(run['site'], run['concurrency']): run for run in json.load(f)['runs']}
+    print(f"Compared with {previous_path}:")
+    for run in runs:
+        old = previous.get((run['site'], run['concurrency']))
+        if not old or 'error' in old or 'error' in run:
+            continue
+        for key, label in (('pages_per_second', 'pages/s'), ('peak_rss_mb', 'peak RSS MB')):
+            change = (run[key] - old[key]) / old[key] * 100 if old[key] else 0.0
+            print(f"  {run['site']} x{run['concurrency']} {label}: {old[key]} -> {run[key]} ({change:+.1f}%)")
+        old_p50, new_p50 = old['latency_ms'].get('p50'), run['latency_ms'].get('p50')
+        if old_p50 and new_p50:
+            print(f"  {run['site']} x{run['concurrency']} p50 ms: {old_p50} -> {new_p50} ({(new_p50 - old_p50) / old_p50 * 100:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the scrapers against the recorded fixtures, offline")
+    parser.add_argument('sites', nargs='*', default=list(ORIGINS), help=f"sites to run (default: all of {list(ORIGINS)})")
+    parser.add_argument('--concurrency', default=','.join(map(str, DEFAULT_CONCURRENCY)),
+                        help="comma-separated tab counts to run each site at (default: %(default)s)")
+    parser.add_argument('--output', help=f"results file (default: {RESULTS_DIR}/benchmark-<time>.json)")
+    parser.add_argument('--compare', help="earlier results file to compare against")
+    args = parser.parse_args()
+    unknown = [site for site in args.sites if site not in ORIGINS]
+    if unknown:
+        parser.error(f"Unknown site(s) {unknown}; choose from {list(ORIGINS)}")
+    levels = [int(level) for level in args.concurrency.split(',')]
+
+    started = datetime.now()
+    server, base_url = start_fixture_server(FIXTURES_DIR)
+    runs = []
+    try:
+        for site in args.sites:
+            for concurrency in levels:
+                print(f"Benchmarking {site} with {concurrency} tab(s)...")
+                run = benchmark(server, base_url, site, concurrency)
+                runs.append(run)
+                if 'error' in run:
+                    print(f"  failed ({run['error']}):\n    " + "\n    ".join(run['output']))
+                else:
+                    print(f"  {run['products']} products, {run['pages_per_second']} pages/s, "
+                          f"p50 {run['latency_ms'].get('p50')} ms, p99 {run['latency_ms'].get('p99')} ms, "
+                          f"peak RSS {run['peak_rss_mb']} MB, {run['bytes_transferred']} bytes")
+    finally:
+        server.shutdown()
+
+    results = {
+        'started': started.isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'python': sys.version.split()[0],
+        'concurrency': levels,
+        'runs': runs,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"benchmark-{started:%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=4)
+    print(f"Results saved to {output}")
+    if args.compare:
+        compare(args.compare, runs)
+
+
+# python benchmark_sites.py [site ...] [--concurrency 1,2,4] [--compare output/benchmarks/<earlier>.json]
+if __name__ == '__main__':
+    if len(sys.argv) == 6 and sys.argv[1] == '--child':
+        _, _, site, concurrency, base_url, result_path = sys.argv
+        result = asyncio.run(run_site(site, int(concurrency), base_url))
+        with open(result_path, 'w') as f:
+            json.dump(result, f)
+    else:
+        main()
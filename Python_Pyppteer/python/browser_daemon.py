@@ -0,0 +1,119 @@
+import asyncio
+import os
+import signal
+import time
+from launcher import launch_browser, ENDPOINT_FILE, PROFILE_DIR
+
+# Seconds between health checks, and how long Chrome gets to answer one
+CHECK_INTERVAL = 10
+CHECK_TIMEOUT = 5
+
+# Restarts in a row without a healthy check in between before the daemon gives up
+MAX_FAILED_RESTARTS = 5
+
+
+# Keeps one Chrome running with a persistent profile and publishes its DevTools endpoint in
+# ENDPOINT_FILE. Scrapers attach with launcher.open_browser(), so a run starts without a Chrome
+# cold start and reuses the HTTP cache left by earlier runs. Chrome is restarted when it dies
+# or stops answering.
+class BrowserDaemon:
+    def __init__(self, profile_dir=PROFILE_DIR, endpoint_file=ENDPOINT_FILE):
+        self.profile_dir = profile_dir
+        self.endpoint_file = endpoint_file
+        self.browser = None
+        self.started_at = None
+        self.restarts = 0
+
+    async def start(self):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        # The daemon owns Chrome's lifetime: it must outlive any one scraper and our own signals
+        self.browser = await launch_browser(user_data_dir=self.profile_dir, autoClose=False,
+                                            handleSIGINT=False, handleSIGTERM=False, handleSIGHUP=False)
+        self.started_at = time.monotonic()
+        self._publish(self.browser.wsEndpoint)
+        print(f"Browser ready at {self.browser.wsEndpoint} (profile {self.profile_dir})")
+
+    # Write the endpoint atomically so a scraper never reads half a url
+    def _publish(self, endpoint):
+        os.makedirs(os.path.dirname(self.endpoint_file) or '.', exist_ok=True)
+        temp_path = self.endpoint_file + '.tmp'
+        with open(temp_path, 'w') as f:
+            f.write(endpoint)
+        os.replace(temp_path, self.endpoint_file)
+
+    async def healthy(self):
+        process = self.browser.process
+        if process is not None and process.poll() is not None:
+            return False
+        try:
+            await asyncio.wait_for(self.browser.version(), CHECK_TIMEOUT)
+            return True
+        except Exception:
+            return False
+
+    async def restart(self):
+        print("Browser is not answering, restarting it")
+        await self.stop(unpublish=False)
+        await self.start()
+        self.restarts += 1
+
+    async def stop(self, unpublish=True):
+        if unpublish and os.path.exists(self.endpoint_file):
+            os.remove(self.endpoint_file)
+        if self.browser is None:
+            return
+        try:
+            await asyncio.wait_for(self.browser.close(), CHECK_TIMEOUT)
+        except Exception as e:
+            print(f"Browser did not close cleanly: {str(e)}")
+            if self.browser.process is not None and self.browser.process.poll() is None:
+                self.browser.process.kill()
+        self.browser = None
+
+    # Health-check until `stopping` is set, restarting Chrome whenever a check fails
+    async def serve(self, stopping):
+        await self.start()
+        failed_restarts = 0
+        try:
+            while not stopping.is_set():
+                try:
+                    await asyncio.wait_for(stopping.wait(), CHECK_INTERVAL)
+                    break
+                except asyncio.TimeoutError:
+                    pass
+                if await self.healthy():
+                    failed_restarts = 0
+                    continue
+                failed_restarts += 1
+                if failed_restarts > MAX_FAILED_RESTARTS:
+                    print(f"Browser failed {MAX_FAILED_RESTARTS} restarts in a row, giving up")
+                    break
+                try:
+                    await self.restart()
+                except Exception as e:
+                    print(f"Failed to restart the browser: {str(e)}")
+        finally:
+            await self.stop()
+
+    def status(self):
+        return {
+            'endpoint': self.browser.wsEndpoint if self.browser else None,
+            'uptime_s': round(time.monotonic() - self.started_at, 1) if self.started_at else None,
+            'restarts': self.restarts,
+        }
+
+
+async def main():
+    stopping = asyncio.Event()
+    loop = asyncio.get_event_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopping.set)
+    daemon = BrowserDaemon()
+    await daemon.serve(stopping)
+    print(f"Browser daemon stopped: {daemon.status()}")
+
+
+# Start once and leave running (Ctrl+C or SIGTERM stops it and Chrome):
+#   python browser_daemon.py
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,105 @@
+import json
+import os
+
+
+# Append-only journal of crawl progress. Every change is one fsync'd JSON line, so after a crash
+# the next run replays it and only does the remaining work:
+#   {"event": "pending", "category": ..., "urls": [...]}   product urls found for a category
+#   {"event": "position", "category": ..., "page": n}      last listing page fully queued
+#   {"event": "done", "url": ..., "fingerprint": ...}      product written to the output stream, with
+#                                                          its listing fingerprint when it has one
+#   {"event": "category_done", "category": ...}            every listing page of the category has been walked
+class CrawlJournal:
+    def __init__(self, path):
+        self.path = path
+        self.done = set()
+        self.fingerprints = {}  # url -> listing fingerprint of the record written for it
+        self.pending = {}
+        self.positions = {}
+        self.completed_categories = set()
+        self.resumed = False
+        self.file = None
+
+    # Replay an existing journal and open it for appending
+    def open(self):
+        ends_mid_line = False
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    ends_mid_line = not line.endswith('\n')
+                    try:
+                        self._apply(json.loads(line))
+                        self.resumed = True
+                    except ValueError:
+                        print(f"Skipping truncated journal line in {self.path}")
+        if self.resumed:
+            print(f"Resuming crawl: {len(self.done)} products already done, "
+                  f"{len(self.completed_categories)} categories complete")
+        self.file = open(self.path, 'a', encoding='utf-8')
+        if ends_mid_line:
+            self.file.write('\n')  # Don't glue new entries onto a line cut short by a crash
+        return self
+
+    def _apply(self, entry):
+        event = entry['event']
+        if event == 'pending':
+            urls = self.pending.setdefault(entry['category'], {})
+            for url in entry['urls']:
+                urls[url] = None
+        elif event == 'position':
+            self.positions[entry['category']] = entry['page']
+        elif event == 'done':
+            self.done.add(entry['url'])
+            if entry.get('fingerprint'):
+                self.fingerprints[entry['url']] = entry['fingerprint']
+        elif event == 'category_done':
+            self.completed_categories.add(entry['category'])
+
+    def _record(self, entry):
+        self._apply(entry)
+        self.file.write(json.dumps(entry) + '\n')
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def add_pending(self, category, urls):
+        if urls:
+            self._record({'event': 'pending', 'category': category, 'urls': list(urls)})
+
+    # Urls found for a category in an earlier run that are not done yet, in discovery order
+    def pending_for(self, category):
+        return [url for url in self.pending.get(category, {}) if url not in self.done]
+
+    def has_pending(self, category):
+        return category in self.pending
+
+    def set_position(self, category, page):
+        self._record({'event': 'position', 'category': category, 'page': page})
+
+    # Last listing page fully queued for a category (0 when nothing has been)
+    def position(self, category):
+        return self.positions.get(category, 0)
+
+    def mark_done(self, url, fingerprint=None):
+        if url not in self.done:
+            entry = {'event': 'done', 'url': url}
+            if fingerprint:
+                entry['fingerprint'] = fingerprint
+            self._record(entry)
+
+    def is_done(self, url):
+        return url in self.done
+
+    def complete_category(self, category):
+        self._record({'event': 'category_done', 'category': category})
+
+    def is_category_complete(self, category):
+        return category in self.completed_categories
+
+    # The run finished: drop the journal so the next run starts from scratch
+    def finish(self):
+        self.file.close()
+        os.remove(self.path)
+
+    def close(self):
+        if self.file and not self.file.closed:
+            self.file.close()
@@ -0,0 +1,113 @@
+import hashlib
+import math
+from urllib.parse import urlsplit, urlunsplit
+
+
+# Canonical form of a product url: lower-case host, no query, fragment or trailing slash
+def normalize_url(url):
+    parts = urlsplit(url.strip())
+    path = parts.path.rstrip('/') or '/'
+    return urlunsplit(((parts.scheme or 'https').lower(), parts.netloc.lower(), path, '', ''))
+
+
+# Fixed-size set of strings that answers "maybe seen" / "definitely not seen". Sized for
+# `capacity` keys at `error_rate` false positives; memory stays at about 1.8 bytes per key for 0.1%.
+class BloomFilter:
+    def __init__(self, capacity, error_rate=0.001):
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    # Double hashing: position i is h1 + i*h2, both halves of one 128-bit blake2b digest
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    # Add a key; True when it was not (as far as the filter can tell) there before
+    def add(self, key):
+        new = False
+        for position in self._positions(key):
+            byte, bit = divmod(position, 8)
+            if not self.bits[byte] & (1 << bit):
+                self.bits[byte] |= 1 << bit
+                new = True
+        return new
+
+    def __contains__(self, key):
+        return all(self.bits[position // 8] & (1 << (position % 8)) for position in self._positions(key))
+
+
+# Products seen so far in a run, keyed by `key(url)` (a normalized url or a product id), and the
+# categories each one was listed in. Only the first listing of a product is scraped; later ones
+# just add their category.
+#   mode="exact" keeps every key and its categories in a dict
+#   mode="bloom" keeps the keys in a BloomFilter and categories only for products listed more than
+#   once, for frontiers too large for a dict; a false positive (about `error_rate` of products)
+#   means that product is skipped
+class SeenIndex:
+    def __init__(self, key=normalize_url, mode="exact", capacity=1_000_000, error_rate=0.001):
+        if mode not in ("exact", "bloom"):
+            raise ValueError(f"Unknown dedupe mode {mode!r}")
+        self.key = key
+        self.mode = mode
+        self.bloom = BloomFilter(capacity, error_rate) if mode == "bloom" else None
+        self.memberships = {}  # exact: key -> categories; bloom: key -> categories after the first
+        self.unique = 0
+        self.duplicates = 0
+
+    # Record that `url` is listed in `category`; True when the product has not been seen before
+    # and should be scraped
+    def add(self, url, category):
+        key = self.key(url)
+        if self.bloom is not None:
+            if self.bloom.add(key):
+                self.unique += 1
+                return True
+            extra = self.memberships.setdefault(key, [])
+            if category not in extra:
+                extra.append(category)
+            self.duplicates += 1
+            return False
+
+        categories = self.memberships.get(key)
+        if categories is None:
+            self.memberships[key] = [category]
+            self.unique += 1
+            return True
+        if category not in categories:
+            categories.append(category)
+        self.duplicates += 1
+        return False
+
+    # True when the product has been recorded with add(), without recording anything
+    def __contains__(self, url):
+        key = self.key(url)
+        return key in self.bloom if self.bloom is not None else key in self.memberships
+
+    # Every category a product was listed in, starting with the one it was scraped under
+    def categories_for(self, url, primary=None):
+        key = self.key(url)
+        if self.bloom is not None:
+            categories = [primary] if primary is not None else []
+            return categories + [c for c in self.memberships.get(key, []) if c not in categories]
+        return list(self.memberships.get(key, [primary] if primary is not None else []))
+
+    # Export transform: the record with its merged category memberships
+    def with_categories(self, record):
+        return dict(record, categories=self.categories_for(record['url'], record.get('category')))
+
+    # Rebuild memberships of products finished by an interrupted run from its journal, so they
+    # are not scraped again under another category and keep all their categories on export
+    def restore(self, journal):
+        for category, urls in journal.pending.items():
+            for url in urls:
+                if journal.is_done(url):
+                    self.add(url, category)
+
+    def stats(self):
+        stats = {'mode': self.mode, 'unique_products': self.unique, 'duplicate_listings': self.duplicates}
+        if self.bloom is not None:
+            stats['bloom_kb'] = round(len(self.bloom.bits) / 1024, 1)
+        return stats
@@ -0,0 +1,69 @@
+import asyncio
+from collections import Counter
+from parsel import Selector
+from http_client import make_pool
+from page_extract import extract_from_selector, apply_post, extract_fields
+from readiness import goto_ready
+from metrics import METRICS
+
+
+# HTTP-first fetch strategy for server-rendered pages: GET the page over a pooled keep-alive
+# client and run the same field spec on it; only if a required field comes back empty is the
+# page loaded in the browser. Records per-site counts of which path produced the data.
+# With a `cache` (http_cache.HttpCache) unchanged pages are read from disk after a 304.
+class FetchStrategy:
+    def __init__(self, site, http=None, cache=None):
+        self.site = site
+        self.http = http or make_pool()
+        self.cache = cache
+        self.stats = Counter()
+
+    def _get(self, url):
+        if self.cache is not None:
+            status, body, _ = self.cache.get(self.http, url)
+            return status, body.decode('utf-8', errors='replace')
+        response = self.http.request('GET', url)
+        return response.status, response.data.decode('utf-8', errors='replace')
+
+    async def _fetch_html(self, url, limiter=None):
+        loop = asyncio.get_event_loop()
+        try:
+            if limiter is None:
+                with METRICS.span('fetch'):
+                    status, html = await loop.run_in_executor(None, self._get, url)
+            else:
+                async with limiter.for_url(url).slot() as slot:
+                    with METRICS.span('fetch'):
+                        status, html = await loop.run_in_executor(None, self._get, url)
+                    slot.status = status
+        except Exception as e:
+            print(f"HTTP fetch failed for {url}: {str(e)}")
+            self.stats['http_error'] += 1
+            return None
+        if status != 200:
+            print(f"HTTP {status} for {url}, falling back to the browser")
+            self.stats['http_error'] += 1
+            return None
+        return html
+
+    # Extract `spec` from `url`, over HTTP when every field in `required` is found there,
+    # otherwise by navigating `page` and extracting in the browser (straight away with `browser_only`)
+    async def extract(self, page, url, spec, readiness, required=(), limiter=None, browser_only=False):
+        html = None if browser_only else await self._fetch_html(url, limiter)
+        if html is not None:
+            with METRICS.span('parse'):
+                fields = apply_post(extract_from_selector(Selector(text=html), spec), spec)
+            missing = [name for name in required if not fields.get(name)]
+            if not missing:
+                self.stats['http'] += 1
+                return fields
+            print(f"HTTP response for {url} is missing {missing}, falling back to the browser")
+            self.stats['http_incomplete'] += 1
+            METRICS.count('browser_fallbacks')
+
+        await goto_ready(page, url, readiness, limiter)
+        self.stats['browser'] += 1
+        return await extract_fields(page, spec)
+
+    def report(self):
+        return {'site': self.site, **dict(self.stats)}
@@ -0,0 +1,96 @@
+import json
+import os
+import sys
+import threading
+from collections import Counter
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+
+# Page number of a request: ?page=2, or Trader Joe's ?filters={"page":2}
+def requested_page(query):
+    params = parse_qs(query)
+    if params.get('page'):
+        return params['page'][0]
+    try:
+        page = json.loads(params['filters'][0]).get('page')
+        return str(page) if page else None
+    except (KeyError, ValueError, AttributeError):
+        return None
+
+
+# Serves a directory of recorded responses so scrapers can run against localhost.
+# A request for /a/b.json?page=2 is answered from a/b.page2.json when that file exists,
+# which lets paginated endpoints be recorded page by page. Extensionless page urls are answered
+# from <path>.html, so /collections/women can be a page while collections/women/ holds its
+# products. A POST to /a/graphql is answered with the recorded a/graphql.post.json, whatever
+# the request body. Responses and body bytes are counted in server.stats.
+class FixtureHandler(SimpleHTTPRequestHandler):
+    def translate_path(self, path):
+        parts = urlsplit(path)
+        base = super().translate_path(parts.path)
+        if not os.path.splitext(base)[1] and not base.endswith(os.sep):
+            base += '.html'
+        page = requested_page(parts.query)
+        if page:
+            stem, ext = os.path.splitext(base)
+            paged = f"{stem}.page{page}{ext}"
+            if os.path.exists(paged):
+                return paged
+            if page != '1':
+                return paged  # Missing later pages are a 404, like running off the end of a collection
+        return base
+
+    def _count(self, **counts):
+        stats = getattr(self.server, 'stats', None)
+        if stats is not None:
+            with self.server.stats_lock:
+                stats.update(counts)
+
+    def send_response(self, code, message=None):
+        super().send_response(code, message)
+        self._count(responses=1, errors=int(code >= 400))
+
+    def send_header(self, keyword, value):
+        super().send_header(keyword, value)
+        if keyword.lower() == 'content-length':
+            self._count(bytes=int(value))
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        path = os.path.splitext(self.translate_path(self.path))[0] + '.post.json'
+        if not os.path.isfile(path):
+            self.send_error(404, "No recorded response")
+            return
+        with open(path, 'rb') as f:
+            body = f.read()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Keep scraper output readable
+
+
+# Start a fixture server on a background thread; returns (server, base_url)
+def start_fixture_server(directory, port=0):
+    handler = lambda *args, **kwargs: FixtureHandler(*args, directory=directory, **kwargs)
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.stats = Counter()
+    server.stats_lock = threading.Lock()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+if __name__ == '__main__':
+    directory = sys.argv[1] if len(sys.argv) > 1 else 'fixtures'
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else 8000
+    server, base_url = start_fixture_server(directory, port)
+    print(f"Serving {directory} at {base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
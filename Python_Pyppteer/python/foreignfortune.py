@@ -1,31 +1,129 @@
 import asyncio
-from pyppeteer import launch
-from parsel import Selector
 import json
+import os
+from tab_pool import TabPool
+from page_lifecycle import PageRecycler
+from dedupe import SeenIndex
+from incremental import IncrementalState
+from validation_stage import ValidationStage
+from shopify import PRODUCT_JSON_XPATH, load_product_json, build_models, discover_catalog, product_handle
+from page_extract import extract_fields
+from selector_registry import SelectorRegistry
+from interception import InterceptionProfile, DEFAULT_BLOCKED_TYPES, TRACKER_DOMAINS
+from readiness import goto_ready, act_ready
+from rate_limiter import LIMITERS
+from http_cache import HTTP_CACHE
+from output_sink import JsonlSink, stream_path, count_records, export_json_array
+from crawl_state import CrawlJournal
+from http_client import make_pool
+from launcher import open_browser, release_browser
+from metrics import METRICS, set_site
+
+# Number of browser tabs scraping product pages in parallel
+CONCURRENCY = 4
+
+# "json" builds variants from the product JSON Shopify embeds in the page (one pass),
+# "clicks" selects every color x size combination in the dropdowns
+EXTRACTION_MODE = "json"
+
+# "http" lists products from the Shopify products.json endpoints without the browser,
+# "browser" walks the rendered collection pages
+DISCOVERY_MODE = "http"
+BASE_URL = "https://foreignfortune.com"
+
+# Products are streamed to output/foreignfortune.jsonl (gzipped when True) as they are scraped
+COMPRESS_OUTPUT = False
+
+# Navigations adapt between these bounds; the tab pool never runs more than CONCURRENCY at once
+LIMITERS.configure('foreignfortune.com', rate=2.0, concurrency=2, max_concurrency=CONCURRENCY)
+
+# Pages and products.json responses are cached on disk and used without asking for 10 minutes,
+# then revalidated (ETag / Last-Modified), so a re-run over an unchanged catalog is mostly 304s
+HTTP_CACHE.configure('foreignfortune.com', max_age=600)
+
+# Requests aborted on every tab; stylesheets stay so the newsletter popup can still be clicked away
+INTERCEPTION = InterceptionProfile(
+    'foreignfortune',
+    blocked_types=DEFAULT_BLOCKED_TYPES,
+    blocked_domains=TRACKER_DOMAINS + ('monorail-edge.shopifysvc.com', 'klaviyo.com', 'privy.com'),
+    cache=HTTP_CACHE
+)
+
+# Collections overlap (frontpage repeats the others): each product handle is scraped once and the
+# export lists every collection it appears in. mode="bloom" bounds memory for huge catalogs.
+SEEN = SeenIndex(key=product_handle, mode="exact")
+
+# Incremental crawl: products whose products.json data (title, prices, image, updated_at) is
+# unchanged since the last run are carried forward from its output instead of re-clicking every
+# variant. Needs DISCOVERY_MODE = "http"; set enabled=False to scrape everything again.
+INCREMENTAL = IncrementalState('foreignfortune', key=product_handle, enabled=True)
+
+# Re-fetches (see validation_stage.py) read every variant off the page by selecting it
+VALIDATOR = ValidationStage("Foreign Fortune", max_refetches=2)
+
+# Tabs are replaced with fresh ones after 50 page loads or once their JS heap passes 300 MB
+RECYCLER = PageRecycler('foreignfortune', setup_page=INTERCEPTION.apply, max_navigations=50, max_heap_mb=300)
+
+# When each kind of page is ready to be read (see readiness.py)
+READINESS = {
+    'listing': {'selector': '#Collection', 'timeout': 20000},
+    'product': {'selector': 'h1', 'timeout': 20000},
+    'variant': {'xpath': '//*[@id="ProductPrice-product-template"]', 'settle_ms': 150, 'timeout': 10000},
+}
+
+# Selectors on the Debut theme's product-template ids (see selector_registry.py)
+REGISTRY = SelectorRegistry('foreignfortune')
+
+# Fields read from each page in one in-page extraction call
+PRODUCT_FIELDS = REGISTRY.spec('product', {
+    'title': {'xpath': '//*[@id="ProductSection-product-template"]/div/div[2]/div/h1/text()'},
+    'description': {'xpath': '//*[@id="ProductSection-product-template"]/div/div[2]/div/div[2]/text()'},
+    'sizes': {'xpath': '//*[@id="SingleOptionSelector-0"]/option/text()', 'all': True},
+    'colors': {'xpath': '//*[@id="SingleOptionSelector-1"]/option/text()', 'all': True},
+    'images': {'xpath': '//*[@id="ProductSection-product-template"]/div/div[1]//img/@src', 'all': True},
+    'base_price': {'xpath': '//*[@id="ProductPrice-product-template"]/text()'},
+    'product_json': {'xpath': PRODUCT_JSON_XPATH},
+})
+VARIANT_FIELDS = REGISTRY.spec('variant', {
+    'price': {'xpath': '//*[@id="ProductPrice-product-template"]/text()'},
+    'image': {'xpath': '//*[@id="FeaturedImage-product-template"]/@src'},
+})
+LISTING_FIELDS = REGISTRY.spec('listing', {
+    'product_links': {'xpath': '//*[@id="Collection"]/div/div/div/a/@href', 'all': True},
+})
+# Absolute path into the newsletter popup; its hit rate in the report shows when the markup moves
+POPUP_FIELDS = REGISTRY.spec('popup', {
+    'close_button': {'xpath': '/html/body/div[6]/div/div[2]/div/div/div/div/div/form/div/div[5]/div[1]/button'},
+})
 
 # Utility function to handle popups
 async def close_popup(page):
+    close_button = POPUP_FIELDS['close_button']['selector']
     try:
-        popup_button_xpath = '/html/body/div[6]/div/div[2]/div/div/div/div/div/form/div/div[5]/div[1]/button'
-        await page.waitForXPath(popup_button_xpath, timeout=10000)
+        popup_button_xpath = close_button.expression
+        with METRICS.span('wait', kind='popup'):
+            await page.waitForXPath(popup_button_xpath, timeout=10000)
         popup_button = await page.xpath(popup_button_xpath)
+        close_button.record_result(popup_button)
         if popup_button:
             await popup_button[0].click()
             print("Popup closed")
         else:
             print("No popup appeared")
     except Exception as e:
+        close_button.record_result(None)
         print(f"No popup appeared: {str(e)}")
 
 # Function to scrape variant data (id, price, image) for a specific combination of color and size
 async def get_variant_id(page, color, size):
     try:
         # Select color and size from dropdowns
-        await page.select('select#SingleOptionSelector-0', size)
-        await page.select('select#SingleOptionSelector-1', color)
+        async def select_variant():
+            await page.select('select#SingleOptionSelector-0', size)
+            await page.select('select#SingleOptionSelector-1', color)
 
-        # Wait for the variant to load after selecting the combination
-        await page.waitForXPath('//*[@id="ProductPrice-product-template"]')
+        # Wait for the price to stop changing after selecting the combination
+        await act_ready(page, select_variant, READINESS['variant'])
 
         # Extract variant id from URL
         current_url = page.url
@@ -33,15 +131,14 @@ async def get_variant_id(page, color, size):
 
 
         # Extract price and image
-        content = await page.content()
-        sel = Selector(text=content)
-        price = sel.xpath('//*[@id="ProductPrice-product-template"]/text()').get()
+        fields = await extract_fields(page, VARIANT_FIELDS)
+        price = fields['price']
         if price:
             price = float(price.replace("$", "").replace(",", "").strip())
         else:
             print(f"Warning: Missing price for color: {color}, size: {size}")
             price = 0.0  # Assign a default value if price is missing
-        image = sel.xpath('//*[@id="FeaturedImage-product-template"]/@src').get()
+        image = fields['image']
         image = f"https:{image}" if image else "N/A"
         if image == "N/A":
             print(f"Warning: Missing image for color: {color}, size: {size}")
@@ -57,38 +154,36 @@ async def get_variant_id(page, color, size):
         print(f"Error scraping variant for {color} {size}: {str(e)}")
         return None
 
-# Function to scrape product details
-async def scrape_product_details(page, product_url, category_name):
+# Function to scrape product details (`extraction_mode` overrides EXTRACTION_MODE)
+async def scrape_product_details(page, product_url, category_name, extraction_mode=None):
+    extraction_mode = extraction_mode or EXTRACTION_MODE
     try:
         print(f"Scraping product details for: {product_url}")
-        await page.goto(product_url)
-        await asyncio.sleep(2)  # Adding delay after navigating to a new product page
-        await page.waitForSelector('h1')
-        content = await page.content()
-        sel = Selector(text=content)
+        await goto_ready(page, product_url, READINESS['product'], LIMITERS)
+        fields = await extract_fields(page, PRODUCT_FIELDS)
 
         # Scraping relevant product details
-        title = sel.xpath('//*[@id="ProductSection-product-template"]/div/div[2]/div/h1/text()').get()
+        title = fields['title']
 
         # Clean description by removing newline characters and extra spaces
-        description = sel.xpath('//*[@id="ProductSection-product-template"]/div/div[2]/div/div[2]/text()').get() or "N/A"
+        description = fields['description'] or "N/A"
         description = description.strip().replace("\n", "").replace("\r", "").strip()  # Clean description
 
         print(f"Title: {title}, Description: {description[:50]}...")  # Log the product title and description
 
         # Scraping available sizes and colors
-        sizes = sel.xpath('//*[@id="SingleOptionSelector-0"]/option/text()').getall() or []
-        colors = sel.xpath('//*[@id="SingleOptionSelector-1"]/option/text()').getall() or []
+        sizes = fields['sizes'] or []
+        colors = fields['colors'] or []
         if not sizes and not colors:
             print(f"Info: No sizes or colors for product: {title}")
 
         # Scraping all product images
-        images = sel.xpath('//*[@id="ProductSection-product-template"]/div/div[1]//img/@src').getall()
+        images = fields['images']
         images = [f"https:{img}" for img in images]  # Add https prefix if needed
         print(f"Images found: {len(images)}")  # Log number of images found
 
         # Extract base price in case there are no sizes or colors
-        base_price = sel.xpath('//*[@id="ProductPrice-product-template"]/text()').get()
+        base_price = fields['base_price']
         if base_price:
             base_price = float(base_price.replace("$", "").replace(",", "").strip())
             print(f"Base price found: {base_price}")
@@ -96,9 +191,16 @@ async def scrape_product_details(page, product_url, category_name):
             print(f"Warning: No base price found for product: {title}")
             base_price = None
 
-        # Structuring the model data (loop through colors and sizes)
+        # Structuring the model data: read every variant from the embedded JSON when the page has it,
+        # otherwise loop through colors and sizes in the dropdowns
         models = []
-        if colors and sizes:
+        product_json = load_product_json(fields['product_json']) if extraction_mode == "json" else None
+        if product_json:
+            models = build_models(product_json)
+            print(f"Variants read from product JSON: {sum(len(model['variants']) for model in models)}")
+        elif colors and sizes:
+            if extraction_mode == "json":
+                print(f"Info: No product JSON for {title}, falling back to selecting variants")
             for color in colors:
                 color_variants = []
                 for size in sizes:
@@ -144,13 +246,36 @@ async def scrape_product_details(page, product_url, category_name):
         print(f"Failed to scrape product details from {product_url}: {str(e)}")
         return None
 
-# Function to scrape all products in a category
-async def scrape_category(page, category_url, category_name):
+# Pool worker: scrape one (product_url, category_name) job on the tab it was handed
+async def scrape_product_job(page, job):
+    product_url, category_name = job
+    if VALIDATOR.refetching(product_url):
+        # The last record failed validation: load the page past the cache and read every variant
+        # off the page by selecting it, rather than from the embedded JSON
+        HTTP_CACHE.invalidate(product_url)
+        return await scrape_product_details(page, product_url, category_name, extraction_mode="clicks")
+    if INCREMENTAL.is_unchanged(product_url):
+        previous = INCREMENTAL.previous_record(product_url)
+        if previous:
+            return dict(previous, url=product_url, category=category_name)
+    product_data = await scrape_product_details(page, product_url, category_name)
+    if product_data:
+        print(f"Scraped product: {product_data['title']}")
+    return product_data
+
+# Function to queue all products in a category onto the tab pool.
+# Listing pages already walked in an interrupted run are skipped and their unfinished products re-queued.
+async def scrape_category(page, pool, journal, category_url, category_name):
     try:
         print(f"Scraping category: {category_url}")
+        queued = 0
+        for product_url in journal.pending_for(category_name):
+            if SEEN.add(product_url, category_name):
+                await pool.put((product_url, category_name))
+                queued += 1
+
         # Open the first page of the category
-        await page.goto(category_url)
-        await asyncio.sleep(2)  # Adding delay after navigating to category page
+        await goto_ready(page, category_url, READINESS['listing'], LIMITERS)
         await close_popup(page)
 
         # Detect the total number of pages
@@ -163,38 +288,41 @@ async def scrape_category(page, category_url, category_name):
 
         print(f"Total pages: {total_pages}")
 
-        all_products = []
-        # Loop through all pages in the category
-        for page_number in range(1, total_pages + 1):
+        # Loop through the pages not walked yet in the category
+        for page_number in range(journal.position(category_name) + 1, total_pages + 1):
             print(f"Scraping page {page_number} of {total_pages} in category {category_url}")
             # If it's not the first page, navigate to the corresponding page URL
             if page_number > 1:
-                await page.goto(f"{category_url}?page={page_number}")
-                await asyncio.sleep(2)  # Delay after navigating to a new page
+                await goto_ready(page, f"{category_url}?page={page_number}", READINESS['listing'], LIMITERS)
                 await close_popup(page)  # Close popup if it reappears
 
-            # Get the page content and parse it with Parsel
-            content = await page.content()
-            sel = Selector(text=content)
-
-            # Extract product links from the current page
-            product_links = sel.xpath('//*[@id="Collection"]/div/div/div/a/@href').getall()
-            for product_link in product_links:
-                product_url = f"https://foreignfortune.com{product_link}"
-                product_data = await scrape_product_details(page, product_url, category_name)
-                if product_data:
-                    print(f"Scraped product: {product_data['title']}")
-                    all_products.append(product_data)
-
-        return all_products
+            # Queue product links from the current page; the pool tabs pick them up immediately
+            product_links = (await extract_fields(page, LISTING_FIELDS))['product_links']
+            product_urls = [f"https://foreignfortune.com{product_link}" for product_link in product_links]
+            journal.add_pending(category_name, product_urls)
+            journal.set_position(category_name, page_number)
+            for product_url in product_urls:
+                if not journal.is_done(product_url) and SEEN.add(product_url, category_name):
+                    await pool.put((product_url, category_name))
+                    queued += 1
+
+        return queued
     except Exception as e:
         print(f"Failed to scrape category: {category_url}, error: {str(e)}")
-        return []
+        return 0
+
+# A category has its full product list in the journal when it was discovered over HTTP;
+# a browser walk records listing positions and may have stopped part way
+def discovered_over_http(journal, category_name):
+    return journal.has_pending(category_name) and not journal.position(category_name)
 
-# Main function to run the scraper
-async def main():
-    browser = await launch(headless=False, executablePath='/usr/bin/google-chrome')
-    page = await browser.newPage()
+# Main function to run the scraper (`browser`: see launcher.open_browser); returns the product count
+async def main(browser=None, report=True):
+    set_site('foreignfortune')
+    own_browser = browser is None
+    if own_browser:
+        browser = await open_browser()
+    page = await RECYCLER.new_page(browser)
 
     categories = [
         {"url": "https://foreignfortune.com/collections/men-unisex", "name": "Men/Unisex"},
@@ -206,27 +334,89 @@ async def main():
         {"url": "https://foreignfortune.com/collections/foreign-accesories", "name": "Accessories"}
     ]
 
-    all_products = []
+    # The journal remembers discovered urls, walked listing pages and finished products,
+    # so a restarted run only does what is left
+    os.makedirs('output', exist_ok=True)
+    journal = CrawlJournal('output/foreignfortune.journal').open()
+    SEEN.restore(journal)
+
+    # Discover product urls with a few small JSON requests before touching the browser
+    # (categories discovered by an interrupted run are taken from the journal instead)
+    if DISCOVERY_MODE == "http":
+        undiscovered = [category for category in categories if not discovered_over_http(journal, category['name'])]
+        if undiscovered:
+            http = make_pool()
+            loop = asyncio.get_event_loop()
+            summaries = {}
+            with METRICS.span('discover'):
+                discovered = await loop.run_in_executor(
+                    None, lambda: discover_catalog(http, BASE_URL, undiscovered, cache=HTTP_CACHE, summaries=summaries))
+            http.clear()
+            for category_name, product_urls in discovered.items():
+                journal.add_pending(category_name, product_urls)
+            for product_url, summary in summaries.items():
+                INCREMENTAL.observe(product_url, summary)
+
+    # Each product is written the moment it (and every product queued before it) is done;
+    # a resumed run appends to the stream of the interrupted one
+    INCREMENTAL.begin(stream_path('foreignfortune', COMPRESS_OUTPUT), resumed=journal.resumed).restore(journal)
+    sink = await JsonlSink(stream_path('foreignfortune', COMPRESS_OUTPUT), append=journal.resumed).open()
+
+    def product_written(product):
+        journal.mark_done(product['url'], INCREMENTAL.written_record(product['url']))
+
+    async def write_product(product):
+        if product:
+            await sink.write(product, on_written=lambda: product_written(product))
+
+    # Listing pages are walked on the main tab (only for categories HTTP discovery missed)
+    # while the pool scrapes product pages; products failing validation are re-queued first
+    pool = await TabPool(browser, scrape_product_job, concurrency=CONCURRENCY, on_result=write_product,
+                         recycler=RECYCLER, validate=lambda job, product: VALIDATOR.needs_refetch(job[0], product)).start()
     for category in categories:
         print(f"Scraping category: {category['name']}")
-        products = await scrape_category(page, category['url'], category['name'])
-        all_products.extend(products)
-
-    # Save scraped data to a JSON file
-    with open('output/foreignfortune.json', 'w') as f:
-        json.dump(all_products, f, indent=4)
-
-    # Save total product count to a file
-    total_count = len(all_products)
+        if DISCOVERY_MODE == "http" and discovered_over_http(journal, category['name']):
+            for product_url in journal.pending_for(category['name']):
+                if SEEN.add(product_url, category['name']):
+                    await pool.put((product_url, category['name']))
+        else:
+            await scrape_category(page, pool, journal, category['url'], category['name'])
+            page = await RECYCLER.maybe_recycle(page)
+
+    # Results are written in queue order, so products stay grouped by category
+    await pool.join()
+    await pool.close()
+    await sink.close()
+    journal.finish()
+    INCREMENTAL.finish()
+    HTTP_CACHE.save()
+    METRICS.save()
+
+    # Export the stream as the pretty JSON array and derive the product count from it
+    export_json_array(sink.path, 'output/foreignfortune.json', transform=SEEN.with_categories)
+    total_count, _ = count_records(sink.path)
     with open('output/foreignfortune_count.txt', 'w') as f:
         f.write(f"Total products scraped: {total_count}")
 
-    # Print total product count in JSON format
+    # Print total product count and blocked request counters in JSON format
     print(json.dumps({"total_products_scraped": total_count}, indent=4))
-
-    # Close browser
-    await browser.close()
+    if report:
+        print(json.dumps(INTERCEPTION.report(), indent=4))
+        print(json.dumps(LIMITERS.stats(), indent=4))
+        print(json.dumps(REGISTRY.report(), indent=4))
+        print(json.dumps(RECYCLER.report(), indent=4))
+        print(json.dumps(SEEN.stats(), indent=4))
+        print(json.dumps(HTTP_CACHE.report(), indent=4))
+        print(json.dumps(INCREMENTAL.report(), indent=4))
+        print(json.dumps(VALIDATOR.report(), indent=4))
+        print(json.dumps(METRICS.summary()['sites'].get('foreignfortune', {}), indent=4))
+
+    # Close the tab, and release the browser when this run opened it
+    await RECYCLER.close_page(page)
+    if own_browser:
+        await release_browser(browser)
     print(f"Total products scraped: {total_count}")
+    return total_count
 
 # Run the script
 if __name__ == '__main__':
@@ -0,0 +1,206 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+# Response bodies are stored once per distinct content under bodies/<sha256[:2]>/<sha256>;
+# index.json maps each url to its body, validators and timestamps
+DEFAULT_CACHE_DIR = os.path.join('.cache', 'http')
+DEFAULT_MAX_BYTES = 500 * 1024 * 1024
+
+# Not kept with a cached response: bodies are stored decoded, and these describe one connection
+UNSTORED_HEADERS = ('content-length', 'content-encoding', 'transfer-encoding', 'connection', 'keep-alive')
+
+
+# Response headers to store, lower-cased; repeated headers (Set-Cookie) are joined with newlines,
+# as Chrome reports them. `headers` is a urllib3 HTTPHeaderDict or a plain mapping.
+def stored_headers(headers):
+    stored = {}
+    items = headers.items() if hasattr(headers, 'getlist') else dict(headers).items()
+    for key, value in items:
+        key = key.lower()
+        if key in UNSTORED_HEADERS:
+            continue
+        stored[key] = f"{stored[key]}\n{value}" if key in stored else value
+    return stored
+
+
+# On-disk cache of GET responses shared by the HTTP fetch path and the browser (through request
+# interception). A cached response is used as is while it is younger than its host's max_age;
+# after that it is revalidated with If-None-Match / If-Modified-Since, so an unchanged page costs
+# a 304 instead of a download. Least recently used bodies are evicted past max_bytes.
+class HttpCache:
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.policies = {}  # host -> seconds a response is used without revalidating
+        self.entries = None  # loaded on first use
+        self.lock = threading.RLock()  # the HTTP path uses the cache from executor threads
+        self.stats = Counter()
+
+    # Freshness policy per site, e.g. configure('www.lechocolat-alainducasse.com', max_age=3600)
+    def configure(self, host, max_age=0):
+        self.policies[host] = max_age
+
+    def _index_path(self):
+        return os.path.join(self.directory, 'index.json')
+
+    def _body_path(self, digest):
+        return os.path.join(self.directory, 'bodies', digest[:2], digest)
+
+    def _load(self):
+        if self.entries is not None:
+            return
+        self.entries = {}
+        try:
+            with open(self._index_path(), 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+        except FileNotFoundError:
+            pass
+        except ValueError:
+            print(f"HTTP cache index {self._index_path()} is corrupt, starting empty")
+
+    # Cached entry for a url whose body is still on disk, or None
+    def lookup(self, url):
+        with self.lock:
+            self._load()
+            entry = self.entries.get(url)
+            if entry and not os.path.exists(self._body_path(entry['sha256'])):
+                del self.entries[url]
+                return None
+            return entry
+
+    def is_fresh(self, url, entry):
+        max_age = self.policies.get((urlsplit(url).hostname or "").lower(), 0)
+        return time.time() - entry['validated_at'] < max_age
+
+    # Headers for a conditional request (empty when the entry has no validators)
+    def conditional_headers(self, entry):
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def read_body(self, entry):
+        with open(self._body_path(entry['sha256']), 'rb') as f:
+            body = f.read()
+        with self.lock:
+            entry['used_at'] = time.time()
+        return body
+
+    # Store a 200 response with its headers (replayed to the browser with the body)
+    def store(self, url, headers, body):
+        headers = stored_headers(headers)
+        if 'no-store' in headers.get('cache-control', ''):
+            return
+        digest = hashlib.sha256(body).hexdigest()
+        path = self._body_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(temp_path, 'wb') as f:
+                f.write(body)
+            os.replace(temp_path, path)
+        now = time.time()
+        with self.lock:
+            self._load()
+            self.entries[url] = {
+                'sha256': digest,
+                'size': len(body),
+                'content_type': headers.get('content-type'),
+                'etag': headers.get('etag'),
+                'last_modified': headers.get('last-modified'),
+                'headers': headers,
+                'validated_at': now,
+                'used_at': now,
+            }
+            self.stats['stored'] += 1
+            self._evict()
+
+    # A 304 confirmed the cached body is current; the headers it carries replace the stored ones
+    def revalidated(self, entry, headers=None):
+        with self.lock:
+            if headers:
+                headers = stored_headers(headers)
+                entry['etag'] = headers.get('etag', entry['etag'])
+                entry['last_modified'] = headers.get('last-modified', entry['last_modified'])
+                if 'headers' in entry:
+                    entry['headers'].update(headers)
+            entry['validated_at'] = entry['used_at'] = time.time()
+            self.stats['revalidated'] += 1
+
+    # Forget a url, so the next request for it goes to the server (e.g. a targeted re-fetch);
+    # its body stays on disk for other urls sharing it until eviction
+    def invalidate(self, url):
+        with self.lock:
+            self._load()
+            if self.entries.pop(url, None) is not None:
+                self.stats['invalidated'] += 1
+
+    # Drop least recently used urls until the distinct bodies fit in max_bytes
+    def _evict(self):
+        sizes = {entry['sha256']: entry['size'] for entry in self.entries.values()}
+        total = sum(sizes.values())
+        if total <= self.max_bytes:
+            return
+        for url, entry in sorted(self.entries.items(), key=lambda item: item[1]['used_at']):
+            if total <= self.max_bytes:
+                break
+            del self.entries[url]
+            self.stats['evicted'] += 1
+            digest = entry['sha256']
+            if not any(other['sha256'] == digest for other in self.entries.values()):
+                total -= sizes[digest]
+                try:
+                    os.remove(self._body_path(digest))
+                except OSError:
+                    pass
+
+    # GET through the cache with a urllib3 pool: returns (status, body bytes, content type);
+    # status is 200 for fresh and revalidated cache hits
+    def get(self, http, url, headers=None):
+        entry = self.lookup(url)
+        if entry and self.is_fresh(url, entry):
+            self.stats['fresh'] += 1
+            return 200, self.read_body(entry), entry['content_type']
+        request_headers = dict(getattr(http, 'headers', None) or {})  # keep the pool's User-Agent
+        request_headers.update(headers or {})
+        if entry:
+            request_headers.update(self.conditional_headers(entry))
+        response = http.request('GET', url, headers=request_headers)
+        if response.status == 304 and entry:
+            self.revalidated(entry, response.headers)
+            return 200, self.read_body(entry), entry['content_type']
+        if response.status == 200:
+            self.stats['downloaded'] += 1
+            self.store(url, response.headers, response.data)
+        return response.status, response.data, response.headers.get('Content-Type')
+
+    # Write the index; call once a run is done (the bodies are already on disk)
+    def save(self):
+        with self.lock:
+            if self.entries is None:
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            temp_path = self._index_path() + '.tmp'
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.entries, f)
+            os.replace(temp_path, self._index_path())
+
+    def report(self):
+        with self.lock:
+            self._load()
+            return {
+                'entries': len(self.entries),
+                'bytes': sum({entry['sha256']: entry['size'] for entry in self.entries.values()}.values()),
+                **dict(self.stats),
+            }
+
+
+# One cache for every scraper in the process (run_all.py runs them side by side)
+HTTP_CACHE = HttpCache()
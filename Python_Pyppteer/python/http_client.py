@@ -0,0 +1,68 @@
+import json
+from urllib.parse import urlencode
+import urllib3
+
+# Browser-like user agent so the shops serve the same responses Chrome gets
+USER_AGENT = ("Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 "
+              "(KHTML, like Gecko) Chrome/120.0 Safari/537.36")
+
+
+# Live origins answered by another server, e.g. {'https://foreignfortune.com': 'http://127.0.0.1:8000/foreignfortune'}.
+# Empty in normal runs; benchmark_sites.py points every shop at a local fixture server.
+ORIGIN_ROUTES = {}
+
+
+# Where a request for `url` actually goes (the url itself unless its origin is routed)
+def route(url):
+    for origin, target in ORIGIN_ROUTES.items():
+        if url == origin or url.startswith((origin + '/', origin + '?')):
+            return target + url[len(origin):]
+    return url
+
+
+# Pool manager sending requests for routed origins to their target; callers (caches, limiters,
+# product urls) keep working with the live urls
+class RoutedPoolManager(urllib3.PoolManager):
+    def urlopen(self, method, url, redirect=True, **kw):
+        return super().urlopen(method, route(url), redirect=redirect, **kw)
+
+
+# Shared keep-alive connection pool; one per scraper run is enough
+def make_pool(maxsize=10, retries=2, timeout=15.0):
+    return RoutedPoolManager(
+        maxsize=maxsize,
+        block=False,
+        retries=urllib3.Retry(total=retries, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504)),
+        timeout=urllib3.Timeout(total=timeout),
+        headers={'User-Agent': USER_AGENT}
+    )
+
+
+# GET a url and decode its JSON body, returning None on any HTTP or decoding error.
+# With a `cache` (http_cache.HttpCache) the response is revalidated instead of downloaded again.
+def get_json(http, url, fields=None, cache=None):
+    try:
+        if cache is not None:
+            if fields:
+                url = f"{url}?{urlencode(fields)}"
+            status, data, _ = cache.get(http, url)
+        else:
+            response = http.request('GET', url, fields=fields)
+            status, data = response.status, response.data
+        if status != 200:
+            print(f"HTTP {status} for {url}")
+            return None
+        return json.loads(data.decode('utf-8'))
+    except Exception as e:
+        print(f"Failed to fetch JSON from {url}: {str(e)}")
+        return None
+
+
+# POST a JSON body (e.g. a GraphQL query) and decode the JSON reply; raises on HTTP errors so
+# callers can count the request as failed
+def post_json(http, url, body):
+    response = http.request('POST', url, body=json.dumps(body).encode('utf-8'),
+                            headers={'Content-Type': 'application/json', 'User-Agent': USER_AGENT})
+    if response.status != 200:
+        raise RuntimeError(f"HTTP {response.status} for {url}")
+    return json.loads(response.data.decode('utf-8'))
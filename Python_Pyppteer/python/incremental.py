@@ -0,0 +1,138 @@
+import gzip
+import hashlib
+import json
+import os
+import zlib
+from collections import Counter
+from dedupe import normalize_url
+
+
+def _open_binary(path):
+    return gzip.open(path, 'rb') if path.endswith('.gz') else open(path, 'rb')
+
+
+# Stable hash of the cheap listing-level data of a product (title, price, image, updated_at, ...)
+def fingerprint(summary):
+    return hashlib.sha1(json.dumps(summary, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+# Incremental crawl state for one site. The listing data seen for each product is fingerprinted;
+# when a product's fingerprint matches the previous run, its record is carried forward from the
+# previous output instead of revisiting the detail page. New and changed products are scraped.
+#   output/<name>.fingerprints.json   fingerprints of the products written by the last run
+#   output/<name>.previous.jsonl[.gz] the last run's stream, read back for carried-forward records
+class IncrementalState:
+    def __init__(self, name, key=normalize_url, enabled=True):
+        self.name = name
+        self.key = key
+        self.enabled = enabled
+        self.fingerprints_path = f"output/{name}.fingerprints.json"
+        self.previous_path = None
+        self.previous_file = None
+        self.previous = {}  # key -> fingerprint from the last run
+        self.offsets = {}  # key -> byte offset of its record in the (uncompressed) previous stream
+        self.observed = {}  # key -> fingerprint seen this run
+        self.written = {}  # key -> fingerprint of records written this run
+        self.stats = Counter()
+
+    # Call before the sink opens `stream_path`: the last run's stream is kept aside to carry
+    # records forward from. A resumed run keeps using the one its interrupted run set aside.
+    def begin(self, stream_path, resumed=False):
+        if not self.enabled:
+            return self
+        directory, base = os.path.split(stream_path)
+        stem, _, ext = base.partition('.')
+        self.previous_path = os.path.join(directory, f"{stem}.previous.{ext}")
+        if not resumed and os.path.exists(stream_path):
+            os.replace(stream_path, self.previous_path)
+        if os.path.exists(self.fingerprints_path):
+            with open(self.fingerprints_path, 'r', encoding='utf-8') as f:
+                self.previous = json.load(f)
+        if os.path.exists(self.previous_path):
+            self._index_previous()
+        print(f"Incremental crawl: {len(self.offsets)} records from the previous run can be carried forward")
+        return self
+
+    # Remember where each previous record starts, so memory holds offsets rather than records.
+    # A gzip stream cut short by a crash is indexed up to its last flushed record.
+    def _index_previous(self):
+        with _open_binary(self.previous_path) as f:
+            try:
+                offset = f.tell()
+                line = f.readline()
+                while line:
+                    try:
+                        record = json.loads(line)
+                        self.offsets[self.key(record['url'])] = offset
+                    except (ValueError, KeyError):
+                        pass  # A line cut short by a crash has nothing to carry forward
+                    offset = f.tell()
+                    line = f.readline()
+            except (EOFError, gzip.BadGzipFile, zlib.error):
+                print(f"{self.previous_path} ends where a crash cut it short")
+
+    # Record the listing data seen for a product this run
+    def observe(self, url, summary):
+        if self.enabled and summary:
+            self.observed[self.key(url)] = fingerprint(summary)
+
+    # True when the product was seen unchanged in the listing and its old record is available
+    def is_unchanged(self, url):
+        if not self.enabled:
+            return False
+        key = self.key(url)
+        current = self.observed.get(key)
+        unchanged = current is not None and self.previous.get(key) == current and key in self.offsets
+        self.stats['unchanged' if unchanged else ('changed' if key in self.previous else 'new')] += 1
+        return unchanged
+
+    # The product's record from the previous run, or None when it can't be read back.
+    # One handle stays open: records are mostly asked for in the order they were written,
+    # so a gzipped stream is decompressed about once rather than once per record.
+    def previous_record(self, url):
+        offset = self.offsets.get(self.key(url))
+        if offset is None:
+            return None
+        try:
+            if self.previous_file is None:
+                self.previous_file = _open_binary(self.previous_path)
+            self.previous_file.seek(offset)
+            return json.loads(self.previous_file.readline())
+        except (OSError, ValueError, EOFError, zlib.error) as e:
+            print(f"Failed to carry forward {url}: {str(e)}")
+            return None
+
+    # A record reached the output; its fingerprint is kept for the next run and returned (for the
+    # crawl journal). Without a listing fingerprint this run (a resumed run skips discovery) the
+    # previous one is kept: a product that changed since is simply scraped again next time.
+    def written_record(self, url):
+        key = self.key(url)
+        fingerprint = self.observed.get(key) or self.previous.get(key)
+        if fingerprint:
+            self.written[key] = fingerprint
+        return fingerprint
+
+    # Fingerprints of the records an interrupted run already wrote, from its journal; call after begin()
+    def restore(self, journal):
+        if not self.enabled:
+            return
+        for url in journal.done:
+            fingerprint = journal.fingerprints.get(url) or self.previous.get(self.key(url))
+            if fingerprint:
+                self.written[self.key(url)] = fingerprint
+
+    # Save this run's fingerprints and drop the previous stream
+    def finish(self):
+        if not self.enabled:
+            return
+        temp_path = self.fingerprints_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.written, f)
+        os.replace(temp_path, self.fingerprints_path)
+        if self.previous_file is not None:
+            self.previous_file.close()
+        if self.previous_path and os.path.exists(self.previous_path):
+            os.remove(self.previous_path)
+
+    def report(self):
+        return {'site': self.name, 'enabled': self.enabled, **dict(self.stats)}
@@ -0,0 +1,179 @@
+import asyncio
+import weakref
+from collections import Counter
+from urllib.parse import urlsplit
+from pyppeteer.errors import NetworkError
+from http_client import ORIGIN_ROUTES, make_pool, route
+
+# The scrapers only read attributes and text, so these never need to be downloaded
+DEFAULT_BLOCKED_TYPES = ('image', 'media', 'font')
+
+# Analytics, ads and chat widgets loaded by the shops
+TRACKER_DOMAINS = (
+    'google-analytics.com',
+    'googletagmanager.com',
+    'googleadservices.com',
+    'doubleclick.net',
+    'facebook.net',
+    'facebook.com',
+    'hotjar.com',
+    'bat.bing.com',
+    'clarity.ms',
+    'pinterest.com',
+    'tiktok.com',
+    'snapchat.com',
+    'criteo.com',
+    'quantserve.com',
+    'scorecardresearch.com',
+    'newrelic.com',
+    'nr-data.net',
+    'optimizely.com',
+)
+
+
+# Resource types the browser may be served from an HttpCache. Only these are: they do not depend
+# on the session, while documents do (region, currency, store and basket cookies), and revalidation
+# goes over urllib3 without the browser's cookies.
+CACHED_TYPES = ('script', 'stylesheet')
+
+
+# Headers for request.respond, which writes one line per key: repeated headers stored joined
+# with newlines (Set-Cookie) are split back into one line each
+def raw_headers(headers):
+    return {key: f"\r\n{key}: ".join(value.split('\n')) for key, value in headers.items()}
+
+
+# Per-site request blocking built on setRequestInterception, with counters for what was blocked.
+# With a `cache` (http_cache.HttpCache), GET requests of CACHED_TYPES are answered from it
+# (revalidating stale entries over HTTP first) and the responses the browser downloads are stored.
+# While http_client.ORIGIN_ROUTES is set (offline benchmarks), requests to routed origins are
+# answered from their target and every other request is aborted, so nothing reaches the internet.
+class InterceptionProfile:
+    def __init__(self, name, blocked_types=DEFAULT_BLOCKED_TYPES, blocked_domains=TRACKER_DOMAINS, cache=None):
+        self.name = name
+        self.blocked_types = set(blocked_types)
+        self.blocked_domains = tuple(blocked_domains)
+        self.cache = cache
+        self.http = None
+        self.fulfilled = weakref.WeakSet()  # requests answered from the cache, not stored again
+        self.allowed = 0
+        self.from_cache = 0
+        self.routed = 0
+        self.blocked_by_type = Counter()
+        self.blocked_by_domain = Counter()
+
+    # Domain that blocks this host, if any (matches the domain itself and its subdomains)
+    def blocked_domain(self, url):
+        host = (urlsplit(url).hostname or "").lower()
+        for domain in self.blocked_domains:
+            if host == domain or host.endswith('.' + domain):
+                return domain
+        return None
+
+    # Turn interception on for a page; call again for every new tab. Turning it on also disables
+    # Chrome's HTTP cache, which is turned back on so the persistent profile's cache is used.
+    async def apply(self, page):
+        await page.setRequestInterception(True)
+        await page.setCacheEnabled(True)
+        page.on('request', lambda request: asyncio.ensure_future(self.handle(request)))
+        if self.cache is not None:
+            page.on('response', lambda response: asyncio.ensure_future(self.store_response(response)))
+
+    def cacheable(self, request):
+        return self.cache is not None and request.method == 'GET' and request.resourceType in CACHED_TYPES
+
+    # Answer a request from the cache when it has a fresh copy or the server confirms (304) the
+    # stored one; True when the request was fulfilled
+    async def respond_from_cache(self, request):
+        if self.http is None:
+            self.http = make_pool()
+        loop = asyncio.get_event_loop()
+        try:
+            entry = self.cache.lookup(request.url)
+            if entry is None:
+                return False
+            status, body, content_type = await loop.run_in_executor(None, self.cache.get, self.http, request.url)
+            entry = self.cache.lookup(request.url)  # refreshed by a revalidation or a new download
+        except Exception as e:
+            print(f"Cache revalidation failed for {request.url}: {str(e)}")
+            return False
+        if status != 200:
+            return False
+        headers = dict((entry or {}).get('headers') or {})  # entries from older runs have none
+        if content_type:
+            headers.setdefault('content-type', content_type)
+        self.fulfilled.add(request)
+        await request.respond({'status': 200, 'headers': raw_headers(headers), 'body': body})
+        self.from_cache += 1
+        return True
+
+    # Fetch a request for a routed origin from its target and hand the response to the browser,
+    # which still sees the live url
+    async def respond_from_route(self, request):
+        if self.http is None:
+            self.http = make_pool()
+        loop = asyncio.get_event_loop()
+        headers = {key: value for key, value in (request.headers or {}).items() if key.lower() != 'host'}
+        body = request.postData.encode('utf-8') if request.postData else None
+        response = await loop.run_in_executor(None, lambda: self.http.request(
+            request.method, request.url, body=body, headers=headers, redirect=False))
+        await request.respond({
+            'status': response.status,
+            'headers': {key: value for key, value in response.headers.items() if key.lower() not in ('content-length', 'content-encoding')},
+            'contentType': response.headers.get('Content-Type'),
+            'body': response.data,
+        })
+        self.routed += 1
+
+    # Keep what the browser downloaded itself, for the next run
+    async def store_response(self, response):
+        request = response.request
+        if (not self.cacheable(request) or request in self.fulfilled
+                or response.status != 200 or response.fromCache):
+            return
+        try:
+            body = await response.buffer()
+        except NetworkError:
+            return  # The body is gone once the page navigates away; it is simply not cached
+        if isinstance(body, str):
+            body = body.encode('utf-8')  # Text bodies come back decoded
+        try:
+            loop = asyncio.get_event_loop()
+            await loop.run_in_executor(None, self.cache.store, response.url, response.headers, body)
+        except Exception as e:
+            print(f"Failed to cache {response.url}: {str(e)}")
+
+    async def handle(self, request):
+        try:
+            domain = self.blocked_domain(request.url)
+            if domain:
+                self.blocked_by_domain[domain] += 1
+                await request.abort()
+            elif request.resourceType in self.blocked_types:
+                self.blocked_by_type[request.resourceType] += 1
+                await request.abort()
+            elif self.cacheable(request) and await self.respond_from_cache(request):
+                pass
+            elif ORIGIN_ROUTES:
+                if route(request.url) != request.url:
+                    await self.respond_from_route(request)
+                else:
+                    self.blocked_by_domain['offline'] += 1
+                    await request.abort()
+            else:
+                self.allowed += 1
+                await request.continue_()
+        except Exception as e:
+            # The page may have navigated away or closed while the request was pending
+            print(f"Interception failed for {request.url}: {str(e)}")
+
+    def report(self):
+        return {
+            'site': self.name,
+            'allowed': self.allowed,
+            'from_cache': self.from_cache,
+            'routed': self.routed,
+            'blocked': sum(self.blocked_by_type.values()) + sum(self.blocked_by_domain.values()),
+            'blocked_by_type': dict(self.blocked_by_type),
+            'blocked_by_domain': dict(self.blocked_by_domain),
+        }
@@ -0,0 +1,71 @@
+import asyncio
+import os
+import weakref
+from pyppeteer import launch, connect
+
+# Chrome used by every scraper; override with the CHROME_PATH environment variable
+CHROME_PATH = os.environ.get('CHROME_PATH', '/usr/bin/google-chrome')
+
+# Set HEADLESS=1 to run without a visible window
+HEADLESS = os.environ.get('HEADLESS', '0') == '1'
+
+# Where browser_daemon.py publishes the DevTools endpoint of its long-lived Chrome, and the
+# profile that Chrome keeps its HTTP cache and cookies in between runs
+ENDPOINT_FILE = os.environ.get('BROWSER_ENDPOINT_FILE', os.path.join('.browser', 'endpoint'))
+PROFILE_DIR = os.environ.get('BROWSER_PROFILE_DIR', os.path.join('.browser', 'profile'))
+
+# Browsers we attached to rather than launched; they are disconnected from, never closed
+_attached = weakref.WeakSet()
+
+
+# Launch one Chrome; the scrapers open their tabs on it (several scrapers can share it)
+async def launch_browser(user_data_dir=None, **options):
+    if user_data_dir:
+        options['userDataDir'] = user_data_dir
+    return await launch(
+        headless=HEADLESS,
+        executablePath=CHROME_PATH,
+        args=['--no-sandbox'],  # Avoids permission issues in certain environments
+        **options
+    )
+
+
+# Attach to the daemon's Chrome when one is running and answering; None otherwise
+async def connect_browser(timeout=5.0):
+    if not os.path.exists(ENDPOINT_FILE):
+        return None
+    with open(ENDPOINT_FILE) as f:
+        endpoint = f.read().strip()
+    browser = None
+    try:
+        browser = await asyncio.wait_for(connect(browserWSEndpoint=endpoint), timeout)
+        await asyncio.wait_for(browser.version(), timeout)
+    except Exception as e:
+        print(f"Browser daemon at {endpoint} is not answering ({str(e) or type(e).__name__}), launching a new browser")
+        if browser is not None:
+            try:
+                await asyncio.wait_for(browser.disconnect(), timeout)
+            except Exception:
+                pass  # The connection is already gone
+        return None
+    _attached.add(browser)
+    return browser
+
+
+# A browser for one run: the warm daemon browser when available, else a freshly launched one.
+# The scrapers' entry points take an optional browser: one passed in (e.g. by run_all.py) is
+# shared and left open; otherwise they open one here and hand it to release_browser when done.
+async def open_browser():
+    browser = await connect_browser()
+    if browser is not None:
+        print(f"Attached to browser daemon at {browser.wsEndpoint}")
+        return browser
+    return await launch_browser()
+
+
+# End a run: leave the daemon's browser running, close one we launched
+async def release_browser(browser):
+    if browser in _attached:
+        await browser.disconnect()
+    else:
+        await browser.close()
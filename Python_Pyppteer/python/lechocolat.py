@@ -1,24 +1,95 @@
 import os
 import asyncio
-from pyppeteer import launch
-from parsel import Selector
 import json
 import re
-
-# Function to scrape product details
-async def scrape_product_details(page, product_url, category):
+from interception import InterceptionProfile, DEFAULT_BLOCKED_TYPES
+from rate_limiter import LIMITERS
+from http_cache import HTTP_CACHE
+from output_sink import JsonlSink, stream_path, count_records, export_json_array
+from fetcher import FetchStrategy
+from selector_registry import SelectorRegistry
+from page_lifecycle import PageRecycler
+from dedupe import SeenIndex, normalize_url
+from incremental import IncrementalState
+from validation_stage import ValidationStage
+from launcher import open_browser, release_browser
+from metrics import METRICS, set_site
+
+LIMITERS.configure('www.lechocolat-alainducasse.com', rate=2.0, concurrency=1, max_concurrency=4)
+
+# The catalog changes rarely: cached pages are used for an hour, then revalidated
+HTTP_CACHE.configure('www.lechocolat-alainducasse.com', max_age=3600)
+
+# Products are streamed to output/lechocolat.jsonl (gzipped when True) as they are scraped
+COMPRESS_OUTPUT = False
+
+# Pages are server-rendered and only waited on for the h1, so stylesheets can go too
+INTERCEPTION = InterceptionProfile('lechocolat', blocked_types=DEFAULT_BLOCKED_TYPES + ('stylesheet',), cache=HTTP_CACHE)
+
+# PrestaShop puts the category in the product path (/uk/chocolates/303-box-of-16-ganaches and
+# /uk/chocolate-gift/303-box-of-16-ganaches are one product), so products are keyed by the
+# product id, the leading digits of the last path segment
+def product_key(product_url):
+    match = re.match(r'(\d+)-', normalize_url(product_url).rsplit('/', 1)[-1])
+    return match.group(1) if match else normalize_url(product_url)
+
+# Categories share products (two even share a listing): each product is scraped once and
+# the export lists every category it appears in
+SEEN = SeenIndex(key=product_key, mode="exact")
+
+# Incremental crawl: products whose listing card (title, price, weight) reads the same as in the
+# last run are carried forward from its output; set enabled=False to scrape everything again
+INCREMENTAL = IncrementalState('lechocolat', key=product_key, enabled=True)
+
+# Re-fetches (see validation_stage.py) load the product page in the browser, past the cache
+VALIDATOR = ValidationStage("Le Chocolat", max_refetches=2)
+
+# The tab is replaced with a fresh one between categories after 50 page loads or past 300 MB of JS heap
+RECYCLER = PageRecycler('lechocolat', setup_page=INTERCEPTION.apply, max_navigations=50, max_heap_mb=300)
+
+# When each kind of page is ready to be read (see readiness.py)
+READINESS = {
+    'listing': {'selector': '.product-miniature', 'timeout': 20000},
+    'product': {'selector': 'h1', 'timeout': 20000},
+}
+
+# Pages are fetched over HTTP first; the browser is only used when these fields are missing
+FETCHER = FetchStrategy('lechocolat', cache=HTTP_CACHE)
+REQUIRED_FIELDS = {
+    'listing': ('product_links',),
+    'product': ('title', 'price_text', 'weight'),
+}
+
+# Selectors on the PrestaShop theme's BEM classes (see selector_registry.py)
+REGISTRY = SelectorRegistry('lechocolat')
+
+# Fields read from each page in one extraction call
+PRODUCT_FIELDS = REGISTRY.spec('product', {
+    'description': {'xpath': "//div[@class='productAccordion__content js-tab-content']/p/text()"},
+    'price_text': {'xpath': '//h3[text()="Price per kilo"]/following-sibling::p[1]/text()'},
+    'images': {'xpath': '/html/body/main/article[1]/section[1]/div/ul/li/a/picture/img/@src', 'all': True},
+    'weight': {'xpath': '//p[contains(@class, "productCard__weight")]/text()'},
+    'title': {'xpath': "//h1[@class='productCard__title']/text()"},
+})
+LISTING_FIELDS = REGISTRY.spec('listing', {
+    'product_links': {'xpath': '//div[contains(@class, "product-miniature")]//a/@href', 'all': True},
+    # One entry per card, in the same order: its text and its first link (for incremental crawls)
+    'cards': {'xpath': '//div[contains(@class, "product-miniature")]', 'all': True},
+    'card_links': {'xpath': '//div[contains(@class, "product-miniature")]/descendant::a[1]/@href', 'all': True},
+})
+
+# Function to scrape product details (`browser_only` skips the HTTP attempt)
+async def scrape_product_details(page, product_url, category, browser_only=False):
     try:
-        await page.goto(product_url)
-        await page.waitForSelector('h1')  
-        content = await page.content()
-        sel = Selector(text=content)
+        fields = await FETCHER.extract(page, product_url, PRODUCT_FIELDS, READINESS['product'],
+                                       REQUIRED_FIELDS['product'], LIMITERS, browser_only=browser_only)
 
         # Scrape title and description
-        description = sel.xpath("//div[@class='productAccordion__content js-tab-content']/p/text()").get() or "N/A"
+        description = fields['description'] or "N/A"
         description = description.strip()
 
         # Scrape price per kilo
-        price_text = sel.xpath('//h3[text()="Price per kilo"]/following-sibling::p[1]/text()').get()
+        price_text = fields['price_text']
 
         # Extract only numerical values from the price per kilo
         if price_text:
@@ -32,18 +103,18 @@ async def scrape_product_details(page, product_url, category):
             price_per_kg = "Price not available"
 
         # Scraping all images based on the provided XPath
-        image_urls = sel.xpath('/html/body/main/article[1]/section[1]/div/ul/li/a/picture/img/@src').getall()
+        image_urls = fields['images']
         image_urls = [f"https://www.lechocolat-alainducasse.com{img}" if not img.startswith("http") else img for img in image_urls]
 
         # Scrape weight using the class name `productCard__weight`
-        weight = sel.xpath('//p[contains(@class, "productCard__weight")]/text()').get().replace("g","") or "N/A"
+        weight = fields['weight'].replace("g","") or "N/A"
         weight = float(weight) if weight != "N/A" else 0
 
         selling_price = weight * (price_per_kg / 1000) if isinstance(price_per_kg, float) else "N/A"
         selling_price = round(selling_price, 2) if isinstance(selling_price, float) else selling_price
 
         # Scrape the product title using new XPath and strip the extra spaces and newlines
-        title = sel.xpath("//h1[@class='productCard__title']/text()").get() or "N/A"
+        title = fields['title'] or "N/A"
         title = title.strip()
 
         # Structured product data
@@ -69,43 +140,63 @@ async def scrape_product_details(page, product_url, category):
         print(f"Failed to scrape product details from {product_url}: {str(e)}")
         return None
 
-# Function to scrape all products in a category
-async def scrape_category(page, category_url, category_name):
-    try:
-        # Open the first page of the category
-        await page.goto(category_url)
+# Check if the link is absolute or relative
+def absolute_product_url(product_link):
+    if not product_link.startswith('http'):
+        return f"https://www.lechocolat-alainducasse.com{product_link}"
+    return product_link
 
-        all_products = []
-        # Get the page content and parse it with Parsel
-        content = await page.content()
-        sel = Selector(text=content)
+# Function to scrape all products in a category, writing each one to the sink as it is scraped
+async def scrape_category(page, sink, category_url, category_name):
+    try:
+        # Open the first page of the category and extract its product links (fine-tuned the XPath selector)
+        listing = await FETCHER.extract(page, category_url, LISTING_FIELDS, READINESS['listing'],
+                                        REQUIRED_FIELDS['listing'], LIMITERS)
+        product_links = listing['product_links']
+        for card_link, card in zip(listing['card_links'] or [], listing['cards'] or []):
+            INCREMENTAL.observe(absolute_product_url(card_link), {'card': ' '.join(card.split())})
 
-        # Extract product links from the current page (fine-tuned the XPath selector)
-        product_links = sel.xpath('//div[contains(@class, "product-miniature")]//a/@href').getall()
+        scraped = 0
 
         for product_link in product_links:
-            # Check if the link is absolute or relative
-            if not product_link.startswith('http'):
-                product_url = f"https://www.lechocolat-alainducasse.com{product_link}"
-            else:
-                product_url = product_link
-
-            product_data = await scrape_product_details(page, product_url, category_name)
+            product_url = absolute_product_url(product_link)
+
+            # Already written under an earlier category: only record this category too
+            if product_url in SEEN:
+                SEEN.add(product_url, category_name)
+                continue
+
+            # Unchanged since the last run: carry its record forward instead of loading the page
+            product_data = None
+            if INCREMENTAL.is_unchanged(product_url):
+                previous = INCREMENTAL.previous_record(product_url)
+                if previous:
+                    product_data = dict(previous, category=category_name)
+            if product_data is None:
+                product_data = await scrape_product_details(page, product_url, category_name)
+
+            # Failing validation: re-fetch it in the browser now, past the cache, a bounded number of times
+            while VALIDATOR.needs_refetch(product_url, product_data):
+                HTTP_CACHE.invalidate(product_url)
+                product_data = await scrape_product_details(page, product_url, category_name, browser_only=True)
             if product_data:
-                all_products.append(product_data)
-
-        # Print all products in the category in JSON format
-        print(json.dumps(all_products, indent=4))
+                await sink.write(product_data, on_written=lambda url=product_url: INCREMENTAL.written_record(url))
+                SEEN.add(product_url, category_name)  # A product that failed is tried again under its next category
+                scraped += 1
 
-        return all_products
+        print(f"Scraped {scraped} products in category {category_name}")
+        return scraped
     except Exception as e:
         print(f"Failed to scrape category: {category_url}, error: {str(e)}")
-        return []
+        return 0
 
-# Main function to run the scraper
-async def main():
-    browser = await launch(headless=False, executablePath='/usr/bin/google-chrome')
-    page = await browser.newPage()
+# Main function to run the scraper (`browser`: see launcher.open_browser); returns the product count
+async def main(browser=None, report=True):
+    set_site('lechocolat')
+    own_browser = browser is None
+    if own_browser:
+        browser = await open_browser()
+    page = await RECYCLER.new_page(browser)
 
     categories = {
         "Gifts": "https://www.lechocolat-alainducasse.com/uk/chocolate-gift",
@@ -115,30 +206,48 @@ async def main():
         "Breakfast & Snacks": "https://www.lechocolat-alainducasse.com/uk/simple-pleasures"
     }
 
-    all_products = []
-    for category_name, category_url in categories.items():
-        print(f"Scraping category: {category_name} - {category_url}")
-        products = await scrape_category(page, category_url, category_name)
-        all_products.extend(products)
-
     # Ensure the output directory exists
     os.makedirs('output', exist_ok=True)
+    INCREMENTAL.begin(stream_path('lechocolat', COMPRESS_OUTPUT))
+    sink = await JsonlSink(stream_path('lechocolat', COMPRESS_OUTPUT)).open()
 
-    # Save scraped data to a JSON file in 'output/lechocolat.json'
-    with open('output/lechocolat.json', 'w') as f:
-        json.dump(all_products, f, indent=4)
-
-    # Save total product count to a text file in 'output/traderjoes_count.txt'
-    total_count = len(all_products)
-    with open('output/output/traderjoes_count.txt.', 'w') as f:
+    for category_name, category_url in categories.items():
+        print(f"Scraping category: {category_name} - {category_url}")
+        await scrape_category(page, sink, category_url, category_name)
+        page = await RECYCLER.maybe_recycle(page)
+    await sink.close()
+    INCREMENTAL.finish()
+    HTTP_CACHE.save()
+    METRICS.save()
+
+    # Export the stream as the pretty JSON array in 'output/lechocolat.json'
+    export_json_array(sink.path, 'output/lechocolat.json', transform=SEEN.with_categories)
+
+    # Save total product count, derived from the stream, to 'output/lechocolat_count.txt'
+    total_count, _ = count_records(sink.path)
+    with open('output/lechocolat_count.txt', 'w') as f:
         f.write(f"Total products scraped: {total_count}")
 
     # Print total product count in JSON format
     print(json.dumps({"total_products_scraped": total_count}, indent=4))
-
-    # Close browser
-    await browser.close()
+    if report:
+        print(json.dumps(INTERCEPTION.report(), indent=4))
+        print(json.dumps(LIMITERS.stats(), indent=4))
+        print(json.dumps(FETCHER.report(), indent=4))
+        print(json.dumps(REGISTRY.report(), indent=4))
+        print(json.dumps(RECYCLER.report(), indent=4))
+        print(json.dumps(SEEN.stats(), indent=4))
+        print(json.dumps(HTTP_CACHE.report(), indent=4))
+        print(json.dumps(INCREMENTAL.report(), indent=4))
+        print(json.dumps(VALIDATOR.report(), indent=4))
+        print(json.dumps(METRICS.summary()['sites'].get('lechocolat', {}), indent=4))
+
+    # Close the tab, and release the browser when this run opened it
+    await RECYCLER.close_page(page)
+    if own_browser:
+        await release_browser(browser)
     print(f"Total products scraped: {total_count}")
+    return total_count
 
 # Run the script
 if __name__ == '__main__':
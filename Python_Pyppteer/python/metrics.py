@@ -0,0 +1,190 @@
+import contextvars
+import json
+import os
+import random
+import time
+from collections import Counter
+
+# Fraction of spans that are timed; every call is still counted. Set METRICS_SAMPLE_RATE=0.1
+# on big production crawls to time one call in ten.
+SAMPLE_RATE = float(os.environ.get('METRICS_SAMPLE_RATE', '1.0'))
+
+# Histogram bucket upper bounds in seconds, from in-page extraction up to slow navigations
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Site the running task works for; set once at the start of a scraper's main. Tasks it starts
+# (tab pool workers, the sink writer) inherit it, so shared modules need no site argument.
+_site = contextvars.ContextVar('metrics_site', default='unknown')
+
+
+def set_site(name):
+    _site.set(name)
+
+
+class _Histogram:
+    def __init__(self):
+        self.buckets = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        for position, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[position] += 1
+                break
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    # Upper bound of the bucket holding the given quantile (the last bound past the largest)
+    def quantile(self, fraction):
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.buckets):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+
+class _Span:
+    __slots__ = ('metrics', 'key', 'start')
+
+    def __init__(self, metrics, key):
+        self.metrics = metrics
+        self.key = key
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics._observe(self.key, time.perf_counter() - self.start, exc_type is not None)
+        return False
+
+
+class _UntimedSpan:
+    __slots__ = ('metrics', 'key')
+
+    def __init__(self, metrics, key):
+        self.metrics = metrics
+        self.key = key
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.metrics.errors[self.key] += 1
+        return False
+
+
+def _labels(site, stage, extra):
+    if not extra:
+        return (('site', site), ('stage', stage))
+    return (('site', site), ('stage', stage)) + tuple(sorted(extra.items()))
+
+
+def _format_labels(labels, **more):
+    pairs = list(labels) + list(more.items())
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + '}'
+
+
+# Stage timings and event counters for every scraper in the process:
+#   with METRICS.span('goto'):              time a stage (labelled with the current site)
+#   with METRICS.span('wait', kind='xpath'): extra labels split a stage further
+#   METRICS.count('retries', stage='product')
+# Exported as Prometheus text and as a JSON summary (save()), once a run is done.
+class Metrics:
+    def __init__(self, sample_rate=SAMPLE_RATE):
+        self.sample_rate = sample_rate
+        self.histograms = {}
+        self.calls = Counter()
+        self.errors = Counter()
+        self.events = Counter()
+
+    def span(self, stage, **labels):
+        key = _labels(_site.get(), stage, labels)
+        self.calls[key] += 1
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return _UntimedSpan(self, key)
+        return _Span(self, key)
+
+    def _observe(self, key, seconds, failed):
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = _Histogram()
+        histogram.observe(seconds)
+        if failed:
+            self.errors[key] += 1
+
+    def count(self, event, value=1, **labels):
+        self.events[(('site', _site.get()), ('event', event)) + tuple(sorted(labels.items()))] += value
+
+    def to_prometheus(self):
+        lines = [
+            "# HELP scraper_stage_seconds Time spent in each scraper stage (sampled spans only)",
+            "# TYPE scraper_stage_seconds histogram",
+        ]
+        for key, histogram in sorted(self.histograms.items()):
+            cumulative = 0
+            for bound, count in zip(BUCKETS, histogram.buckets):
+                cumulative += count
+                lines.append(f"scraper_stage_seconds_bucket{_format_labels(key, le=bound)} {cumulative}")
+            lines.append(f"scraper_stage_seconds_bucket{_format_labels(key, le='+Inf')} {histogram.count}")
+            lines.append(f"scraper_stage_seconds_sum{_format_labels(key)} {histogram.sum:.6f}")
+            lines.append(f"scraper_stage_seconds_count{_format_labels(key)} {histogram.count}")
+        lines += ["# HELP scraper_stage_calls_total Calls of each scraper stage, timed or not",
+                  "# TYPE scraper_stage_calls_total counter"]
+        lines += [f"scraper_stage_calls_total{_format_labels(key)} {count}" for key, count in sorted(self.calls.items())]
+        lines += ["# HELP scraper_stage_errors_total Scraper stage calls that raised",
+                  "# TYPE scraper_stage_errors_total counter"]
+        lines += [f"scraper_stage_errors_total{_format_labels(key)} {count}" for key, count in sorted(self.errors.items())]
+        lines += ["# HELP scraper_events_total Scraper events (retries, records written, ...)",
+                  "# TYPE scraper_events_total counter"]
+        lines += [f"scraper_events_total{_format_labels(key)} {count}" for key, count in sorted(self.events.items())]
+        return '\n'.join(lines) + '\n'
+
+    # Per site: every stage with its calls, estimated total time and latency quantiles, and the events
+    def summary(self):
+        sites = {}
+        for key, calls in self.calls.items():
+            labels = dict(key)
+            site = sites.setdefault(labels.pop('site'), {'stages': {}, 'events': {}})
+            name = ' '.join([labels.pop('stage')] + [f"{label}={value}" for label, value in labels.items()])
+            histogram = self.histograms.get(key)
+            stage = {'calls': calls, 'errors': self.errors.get(key, 0)}
+            if histogram and histogram.count:
+                stage.update({
+                    'timed': histogram.count,
+                    'total_seconds': round(histogram.sum * calls / histogram.count, 3),  # scaled up from the sample
+                    'mean_ms': round(histogram.sum / histogram.count * 1000, 2),
+                    'p50_ms': round(histogram.quantile(0.5) * 1000, 1),
+                    'p90_ms': round(histogram.quantile(0.9) * 1000, 1),
+                    'p99_ms': round(histogram.quantile(0.99) * 1000, 1),
+                    'max_ms': round(histogram.max * 1000, 1),
+                })
+            site['stages'][name] = stage
+        for key, count in self.events.items():
+            labels = dict(key)
+            site = sites.setdefault(labels.pop('site'), {'stages': {}, 'events': {}})
+            name = ' '.join([labels.pop('event')] + [f"{label}={value}" for label, value in labels.items()])
+            site['events'][name] = count
+        return {'sample_rate': self.sample_rate, 'sites': sites}
+
+    # Write output/metrics.prom and output/metrics.json
+    def save(self, directory='output', name='metrics'):
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f"{name}.prom"), 'w') as f:
+            f.write(self.to_prometheus())
+        with open(os.path.join(directory, f"{name}.json"), 'w') as f:
+            json.dump(self.summary(), f, indent=4)
+
+
+# Shared by all scrapers in this process
+METRICS = Metrics()
@@ -0,0 +1,149 @@
+import asyncio
+import gzip
+import json
+import os
+import zlib
+from collections import Counter
+from metrics import METRICS
+
+
+# Output file for a scraper's record stream, e.g. output/foreignfortune.jsonl(.gz)
+def stream_path(name, compress=False):
+    return f"output/{name}.jsonl.gz" if compress else f"output/{name}.jsonl"
+
+
+def _open_text(path, mode):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+# A gzipped stream whose run crashed ends in a member with no trailer (each run appends one).
+# Its flushed records are still readable, so they are rewritten as a complete member; appending
+# after the damaged one would leave the next run's records unreadable. True when it was repaired.
+def repair_gzip(path, block_size=1024 * 1024):
+    temp_path = path + '.repair'
+    complete = True
+    last_byte = b'\n'
+    with open(path, 'rb') as source, gzip.open(temp_path, 'wb') as out:
+        data = source.read(block_size)
+        while data:
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            while data and not decompressor.eof:
+                try:
+                    chunk = decompressor.decompress(data)
+                except zlib.error:
+                    break  # Garbage where a member should continue
+                if chunk:
+                    out.write(chunk)
+                    last_byte = chunk[-1:]
+                data = decompressor.unused_data or source.read(block_size)
+            if not decompressor.eof:
+                complete = False
+                break
+            data = data.lstrip(b'\0') or source.read(block_size)  # Padding after the last member
+        if last_byte != b'\n':
+            out.write(b'\n')  # Start after the line a crash cut short
+    if complete:
+        os.remove(temp_path)
+        return False
+    os.replace(temp_path, path)
+    print(f"Repaired {path}: its last run stopped before closing the gzip stream")
+    return True
+
+
+# Writes each record as one compact JSON line as soon as it is produced.
+# Producers only enqueue; a single writer task owns the file and flushes after every record,
+# so a crash loses at most the record being written.
+class JsonlSink:
+    def __init__(self, path, append=False):
+        self.path = path
+        self.append = append
+        self.count = 0
+        self.queue = None
+        self.file = None
+        self.task = None
+
+    async def open(self):
+        if self.append and self.path.endswith('.gz') and os.path.exists(self.path):
+            repair_gzip(self.path)
+        ends_mid_line = False
+        if self.append and not self.path.endswith('.gz') and os.path.exists(self.path):
+            with open(self.path, 'rb') as f:
+                f.seek(0, os.SEEK_END)
+                if f.tell():
+                    f.seek(-1, os.SEEK_END)
+                    ends_mid_line = f.read(1) != b'\n'
+        self.file = _open_text(self.path, 'a' if self.append else 'w')
+        if ends_mid_line:
+            self.file.write('\n')  # Start after the line a crash cut short
+        self.queue = asyncio.Queue()
+        self.task = asyncio.ensure_future(self._writer())
+        return self
+
+    # on_written is called once the line has been flushed, e.g. to mark the product done in a journal
+    async def write(self, record, on_written=None):
+        await self.queue.put((json.dumps(record, ensure_ascii=False, separators=(',', ':')), on_written))
+
+    async def _writer(self):
+        while True:
+            item = await self.queue.get()
+            if item is None:
+                return
+            line, on_written = item
+            with METRICS.span('write'):
+                self.file.write(line + '\n')
+                self.file.flush()
+            self.count += 1
+            METRICS.count('records_written')
+            if on_written:
+                on_written()
+
+    # Drain everything queued so far and close the file
+    async def close(self):
+        await self.queue.put(None)
+        await self.task
+        self.file.close()
+
+
+# Read records back from a JSONL stream; a line cut short by a crash is skipped, and a gzip
+# stream that ends without its trailer ends at the last record that was flushed
+def iter_jsonl(path):
+    with _open_text(path, 'r') as f:
+        try:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    print(f"Skipping truncated line in {path}")
+        except (EOFError, gzip.BadGzipFile, zlib.error):
+            print(f"{path} ends where a crash cut it short")
+
+
+# Count the records in a stream, optionally grouped by one field (e.g. 'category')
+def count_records(path, key=None):
+    total = 0
+    per_key = Counter()
+    for record in iter_jsonl(path):
+        total += 1
+        if key:
+            per_key[record.get(key)] += 1
+    return total, per_key
+
+
+# Post-processing export: the pretty `json.dump(..., indent=4)` array the scripts used to write,
+# produced one record at a time so memory stays flat. `transform` may rewrite each record first.
+def export_json_array(jsonl_path, json_path, transform=None):
+    with open(json_path, 'w', encoding='utf-8') as out:
+        first = True
+        for record in iter_jsonl(jsonl_path):
+            if transform:
+                record = transform(record)
+            out.write('[\n' if first else ',\n')
+            first = False
+            body = json.dumps(record, indent=4)
+            out.write('\n'.join('    ' + line for line in body.split('\n')))
+        out.write('[]' if first else '\n]')
@@ -0,0 +1,100 @@
+from parsel import Selector
+from metrics import METRICS
+
+# "evaluate" runs the field spec inside the page and only ships the values back over DevTools,
+# "parsel" serializes the whole document with page.content() and parses it in Python
+EXTRACT_MODE = "evaluate"
+
+# A field spec maps a field name to where its value lives:
+#   {'xpath': '...'}                  text/attribute nodes give their value, elements their text
+#   {'css': '...', 'attr': 'src'}     attribute of the matched elements (text content without 'attr')
+#   'all': True                       return every match instead of the first one
+#   'post': callable                  applied in Python to the raw value (or list of values)
+#   'selector': CompiledSelector      added by SelectorRegistry.spec(); used instead of re-parsing the expression
+EXTRACT_JS = """
+(spec) => {
+    const out = {};
+    for (const [name, field] of Object.entries(spec)) {
+        let nodes = [];
+        if (field.xpath) {
+            const result = document.evaluate(field.xpath, document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+            for (let i = 0; i < result.snapshotLength; i++) {
+                nodes.push(result.snapshotItem(i));
+            }
+        } else if (field.css) {
+            nodes = Array.from(document.querySelectorAll(field.css));
+        }
+        const values = [];
+        for (const node of nodes) {
+            let value;
+            if (field.attr) {
+                value = node.getAttribute ? node.getAttribute(field.attr) : null;
+            } else if (node.nodeType === Node.ELEMENT_NODE) {
+                value = node.textContent;
+            } else {
+                value = node.nodeValue;
+            }
+            if (value !== null && value !== undefined) {
+                values.push(value);
+            }
+        }
+        out[name] = field.all ? values : (values.length ? values[0] : null);
+    }
+    return out;
+}
+"""
+
+
+# Keep only the JSON-serializable part of the spec for page.evaluate
+def to_js_spec(spec):
+    return {
+        name: {key: field[key] for key in ('xpath', 'css', 'attr', 'all') if key in field}
+        for name, field in spec.items()
+    }
+
+
+# Evaluate a field spec against an already parsed document (the parsel fallback path)
+def extract_from_selector(sel, spec):
+    raw = {}
+    for name, field in spec.items():
+        if field.get('selector'):
+            values = field['selector'].evaluate(sel.root)
+        elif field.get('xpath'):
+            values = sel.xpath(field['xpath']).getall()
+        elif field.get('attr'):
+            values = sel.css(f"{field['css']}::attr({field['attr']})").getall()
+        else:
+            values = [node.xpath('string()').get() for node in sel.css(field['css'])]
+        raw[name] = values if field.get('all') else (values[0] if values else None)
+    return raw
+
+
+# Run each field's post-processing step on the raw values
+def apply_post(raw, spec):
+    result = {}
+    for name, field in spec.items():
+        value = raw.get(name)
+        result[name] = field['post'](value) if field.get('post') else value
+    return result
+
+
+# Extract every field in the spec with a single page.evaluate call, falling back to
+# page.content() + parsel if the in-page run fails or mode is "parsel"
+async def extract_fields(page, spec, mode=None):
+    mode = mode or EXTRACT_MODE
+    raw = None
+    if mode == "evaluate":
+        try:
+            with METRICS.span('extract'):
+                raw = await page.evaluate(EXTRACT_JS, to_js_spec(spec))
+            for name, field in spec.items():
+                if field.get('selector'):
+                    field['selector'].record_result(raw.get(name))
+        except Exception as e:
+            print(f"In-page extraction failed, falling back to parsel: {str(e)}")
+    if raw is None:
+        with METRICS.span('content'):
+            content = await page.content()
+        with METRICS.span('parse'):
+            raw = extract_from_selector(Selector(text=content), spec)
+    return apply_post(raw, spec)
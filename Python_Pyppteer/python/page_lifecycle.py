@@ -0,0 +1,83 @@
+from collections import Counter
+
+MB = 1024 * 1024
+
+
+# Opens tabs and swaps them for fresh ones before they get heavy. Chrome tab memory grows with
+# every navigation (SPA navigations especially), so a tab is recycled after `max_navigations`
+# main-frame navigations or once its JS heap, sampled over CDP (Performance.getMetrics), passes
+# `max_heap_mb`. New tabs get the same viewport and setup (e.g. request interception).
+class PageRecycler:
+    def __init__(self, name, setup_page=None, max_navigations=50, max_heap_mb=300, viewport=None):
+        self.name = name
+        self.setup_page = setup_page  # optional async callable run on every new tab
+        self.max_navigations = max_navigations
+        self.max_heap_mb = max_heap_mb
+        self.viewport = viewport or {'width': 1366, 'height': 768}
+        self.navigations = {}  # page -> main-frame navigations since it was opened
+        self.opened = 0
+        self.recycled = Counter()
+        self.peak_heap = 0
+        self.peak_nodes = 0
+
+    async def new_page(self, browser):
+        page = await browser.newPage()
+        await page.setViewport(self.viewport)
+        if self.setup_page:
+            await self.setup_page(page)
+        self.navigations[page] = 0
+        page.on('framenavigated', lambda frame: self._count_navigation(page, frame))
+        self.opened += 1
+        return page
+
+    def _count_navigation(self, page, frame):
+        if frame is page.mainFrame and page in self.navigations:
+            self.navigations[page] += 1
+
+    # JS heap in bytes (also tracking the run's peaks); None when the tab can't be sampled
+    async def sample(self, page):
+        try:
+            metrics = await page.metrics()
+        except Exception as e:
+            print(f"Failed to read metrics of tab: {str(e)}")
+            return None
+        heap = metrics.get('JSHeapUsedSize', 0)
+        self.peak_heap = max(self.peak_heap, heap)
+        self.peak_nodes = max(self.peak_nodes, metrics.get('Nodes', 0))
+        return heap
+
+    # Call between jobs: returns `page` while it is still light, otherwise closes it and
+    # returns a fresh tab set up the same way
+    async def maybe_recycle(self, page):
+        heap = await self.sample(page)
+        if self.navigations.get(page, 0) >= self.max_navigations:
+            reason = 'navigations'
+        elif heap is None:
+            reason = 'unresponsive'
+        elif heap >= self.max_heap_mb * MB:
+            reason = 'memory'
+        else:
+            return page
+        return await self.recycle(page, reason)
+
+    async def recycle(self, page, reason):
+        browser = page.browser
+        await self.close_page(page)
+        self.recycled[reason] += 1
+        return await self.new_page(browser)
+
+    async def close_page(self, page):
+        self.navigations.pop(page, None)
+        try:
+            await page.close()
+        except Exception as e:
+            print(f"Failed to close tab: {str(e)}")
+
+    def report(self):
+        return {
+            'site': self.name,
+            'tabs_opened': self.opened,
+            'recycled': dict(self.recycled),
+            'peak_js_heap_mb': round(self.peak_heap / MB, 1),
+            'peak_dom_nodes': int(self.peak_nodes),
+        }
@@ -0,0 +1,153 @@
+import asyncio
+import random
+import time
+from urllib.parse import urlsplit
+from pyppeteer.errors import TimeoutError as PageTimeoutError
+from metrics import METRICS
+
+# Errors that mean the site is slow or overloaded (as opposed to a missing element)
+TIMEOUT_ERRORS = (asyncio.TimeoutError, PageTimeoutError)
+
+# Starting point for every host unless the scraper configures it
+DEFAULT_SETTINGS = {
+    'rate': 2.0,               # requests per second refilled into the bucket
+    'burst': 4,                # bucket size
+    'min_rate': 0.2,
+    'max_rate': 10.0,
+    'concurrency': 2,          # requests allowed in flight at once
+    'min_concurrency': 1,
+    'max_concurrency': 8,
+    'target_latency': 8.0,     # seconds; slower successes don't raise the limits
+    'decrease': 0.5,           # multiplicative back-off on 429/5xx/timeouts
+}
+
+
+# Tracks the outcome of one request made under a HostLimiter
+class _Slot:
+    def __init__(self, limiter):
+        self.limiter = limiter
+        self.status = None  # set to the HTTP status when there is a response
+        self.start = None
+
+    async def __aenter__(self):
+        with METRICS.span('limiter_wait'):
+            await self.limiter.acquire()
+        self.start = time.monotonic()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        latency = time.monotonic() - self.start
+        overloaded = (
+            (exc_type is not None and issubclass(exc_type, TIMEOUT_ERRORS))
+            or self.status == 429
+            or (self.status is not None and self.status >= 500)
+        )
+        self.limiter.release(latency, overloaded)
+        return False
+
+
+# Token bucket plus AIMD concurrency for one host: limits grow additively while responses
+# are fast and healthy and are cut multiplicatively on 429/5xx or timeouts
+class HostLimiter:
+    def __init__(self, host, **settings):
+        self.host = host
+        self.settings = dict(DEFAULT_SETTINGS, **settings)
+        self.rate = float(self.settings['rate'])
+        self.concurrency = float(self.settings['concurrency'])
+        self.tokens = float(self.settings['burst'])
+        self.last_refill = time.monotonic()
+        self.in_flight = 0
+        self.requests = 0
+        self.backoffs = 0
+        self._condition = None  # created on first use so it binds to the running loop
+
+    def slot(self):
+        return _Slot(self)
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.settings['burst'], self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    async def acquire(self):
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        async with self._condition:
+            while self.in_flight >= max(1, int(self.concurrency)):
+                await self._condition.wait()
+            self.in_flight += 1
+
+        # Then wait for a token so requests are also spaced out in time; a caller cancelled
+        # while waiting gives its slot back
+        try:
+            while True:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    break
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+        except BaseException:
+            self.in_flight -= 1
+            asyncio.ensure_future(self._notify())
+            raise
+        self.requests += 1
+
+    def release(self, latency, overloaded):
+        self.in_flight -= 1
+        settings = self.settings
+        if overloaded:
+            self.backoffs += 1
+            self.concurrency = max(settings['min_concurrency'], self.concurrency * settings['decrease'])
+            self.rate = max(settings['min_rate'], self.rate * settings['decrease'])
+            print(f"Backing off {self.host}: concurrency {self.concurrency:.1f}, rate {self.rate:.2f}/s")
+        elif latency <= settings['target_latency']:
+            # Roughly +1 concurrency and +0.5 req/s per window of `concurrency` healthy requests
+            self.concurrency = min(settings['max_concurrency'], self.concurrency + 1.0 / self.concurrency)
+            self.rate = min(settings['max_rate'], self.rate + 0.5 / self.concurrency)
+        if self._condition is not None:
+            asyncio.ensure_future(self._notify())
+
+    async def _notify(self):
+        async with self._condition:
+            self._condition.notify_all()
+
+    # Delay before retry number `attempt` (0-based): exponential with jitter, slower when backed off
+    def backoff(self, attempt):
+        base = 1.0 / self.rate
+        return min(30.0, base * (2 ** attempt)) * random.uniform(0.5, 1.5)
+
+    def stats(self):
+        return {
+            'host': self.host,
+            'rate': round(self.rate, 2),
+            'concurrency': round(self.concurrency, 2),
+            'in_flight': self.in_flight,
+            'requests': self.requests,
+            'backoffs': self.backoffs,
+        }
+
+
+# One HostLimiter per domain, shared by every tab and fetcher in the process
+class RateLimiterRegistry:
+    def __init__(self):
+        self.limiters = {}
+        self.settings = {}
+
+    # Override the defaults for a host before it is first used
+    def configure(self, host, **settings):
+        self.settings[host] = settings
+        if host in self.limiters:
+            self.limiters[host].settings.update(settings)
+
+    def for_url(self, url):
+        host = (urlsplit(url).hostname or "").lower()
+        if host not in self.limiters:
+            self.limiters[host] = HostLimiter(host, **self.settings.get(host, {}))
+        return self.limiters[host]
+
+    def stats(self):
+        return [limiter.stats() for limiter in self.limiters.values()]
+
+
+# Shared by all scrapers in this process
+LIMITERS = RateLimiterRegistry()
@@ -0,0 +1,107 @@
+import asyncio
+from metrics import METRICS
+
+# A readiness config says when a page is usable, e.g.
+#   {'selector': 'h1'}                         a CSS selector is present
+#   {'xpath': '//h1[...]'}                     an XPath matches
+#   {'settle_ms': 300}                         no DOM mutation for 300 ms
+#   {'response': '/api/graphql'}               a response whose url contains this string has arrived
+#   'timeout'      ms allowed for each condition (default 30000)
+#   'wait_until'   goto lifecycle event (default 'domcontentloaded')
+#   'goto_timeout' ms allowed for the navigation itself (default 60000)
+DEFAULT_TIMEOUT = 30000
+
+# Resolves once the DOM has gone quiet for `quietMs`, or after `timeoutMs` regardless
+SETTLE_JS = """
+(quietMs, timeoutMs) => new Promise(resolve => {
+    let quietTimer = null;
+    let deadline = null;
+    const observer = new MutationObserver(() => {
+        clearTimeout(quietTimer);
+        quietTimer = setTimeout(done, quietMs);
+    });
+    function done() {
+        observer.disconnect();
+        clearTimeout(quietTimer);
+        clearTimeout(deadline);
+        resolve(true);
+    }
+    observer.observe(document, {childList: true, subtree: true, attributes: true, characterData: true});
+    quietTimer = setTimeout(done, quietMs);
+    deadline = setTimeout(done, timeoutMs);
+})
+"""
+
+
+# Start listening for the configured response; must run before the action that triggers it
+def expect_response(page, config):
+    pattern = config.get('response')
+    if not pattern:
+        return None
+    timeout = config.get('timeout', DEFAULT_TIMEOUT)
+    return asyncio.ensure_future(page.waitForResponse(lambda response: pattern in response.url, {'timeout': timeout}))
+
+
+# Wait until every condition in the config holds. A missing selector raises like waitForSelector,
+# a response that never shows up only logs a warning.
+async def wait_ready(page, config, response_task=None):
+    timeout = config.get('timeout', DEFAULT_TIMEOUT)
+
+    if response_task is not None:
+        try:
+            with METRICS.span('wait', kind='response'):
+                await response_task
+        except Exception as e:
+            print(f"Warning: No response matching '{config.get('response')}' on {page.url}: {str(e)}")
+
+    if config.get('selector'):
+        with METRICS.span('wait', kind='selector'):
+            await page.waitForSelector(config['selector'], {'timeout': timeout})
+    if config.get('xpath'):
+        with METRICS.span('wait', kind='xpath'):
+            await page.waitForXPath(config['xpath'], {'timeout': timeout})
+
+    if config.get('settle_ms'):
+        with METRICS.span('wait', kind='settle'):
+            await page.evaluate(SETTLE_JS, config['settle_ms'], timeout)
+
+
+# Navigate and return as soon as the page is ready instead of sleeping a fixed time.
+# With a RateLimiterRegistry the navigation waits for its host's limiter and reports back to it.
+async def goto_ready(page, url, config, limiter=None):
+    if limiter is None:
+        return await _goto_ready(page, url, config)
+    async with limiter.for_url(url).slot() as slot:
+        response = await _goto_ready(page, url, config, slot)
+    return response
+
+
+async def _goto_ready(page, url, config, slot=None):
+    response_task = expect_response(page, config)
+    try:
+        with METRICS.span('goto'):
+            response = await page.goto(url, {
+                'waitUntil': config.get('wait_until', 'domcontentloaded'),
+                'timeout': config.get('goto_timeout', DEFAULT_TIMEOUT * 2)
+            })
+    except Exception:
+        if response_task is not None:
+            response_task.cancel()
+        raise
+    if slot is not None and response is not None:
+        slot.status = response.status
+    await wait_ready(page, config, response_task)
+    return response
+
+
+# Run an in-page action (a click, a select) and wait for the page to be ready again
+async def act_ready(page, action, config):
+    response_task = expect_response(page, config)
+    try:
+        with METRICS.span('action'):
+            await action()
+    except Exception:
+        if response_task is not None:
+            response_task.cancel()
+        raise
+    await wait_ready(page, config, response_task)
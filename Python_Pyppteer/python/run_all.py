@@ -0,0 +1,99 @@
+import asyncio
+import json
+import os
+import sys
+import time
+import foreignfortune
+import lechocolat
+import traderjoes
+from launcher import open_browser, release_browser
+from rate_limiter import LIMITERS
+from http_cache import HTTP_CACHE
+from metrics import METRICS
+
+
+# One shop as seen by the runner: its scraper module, the coroutine that crawls it on a given
+# browser, and how many tabs it may keep busy at once (None keeps the script's own setting)
+class SiteAdapter:
+    def __init__(self, name, module, entry, host, concurrency=None):
+        self.name = name
+        self.module = module
+        self.entry = entry
+        self.host = host
+        self.concurrency = concurrency
+
+    # Apply the tab budget to the script and to its host's limiter ceiling
+    def apply_budget(self):
+        if self.concurrency is None:
+            return
+        self.module.CONCURRENCY = self.concurrency
+        tabs = self.concurrency + getattr(self.module, 'LISTING_CONCURRENCY', 0)
+        LIMITERS.configure(self.host, **dict(LIMITERS.settings.get(self.host, {}), max_concurrency=tabs))
+
+    async def run(self, browser):
+        start = time.monotonic()
+        try:
+            products = await self.entry(browser, report=False)
+            error = None
+        except Exception as e:
+            print(f"Site {self.name} failed: {str(e)}")
+            products, error = None, str(e)
+        return {'site': self.name, 'products': products, 'seconds': round(time.monotonic() - start, 1), 'error': error}
+
+    # The per-site counters the scripts print when run on their own
+    def reports(self):
+        reports = [self.module.INTERCEPTION.report(), self.module.REGISTRY.report(),
+                   self.module.RECYCLER.report(), self.module.SEEN.stats(), self.module.INCREMENTAL.report(),
+                   self.module.VALIDATOR.report()]
+        if hasattr(self.module, 'FETCHER'):
+            reports.append(self.module.FETCHER.report())
+        return reports
+
+
+# Every registered site; adding a shop means adding its adapter here
+SITES = {
+    'foreignfortune': SiteAdapter('foreignfortune', foreignfortune, foreignfortune.main, 'foreignfortune.com', concurrency=4),
+    'lechocolat': SiteAdapter('lechocolat', lechocolat, lechocolat.main, 'www.lechocolat-alainducasse.com'),
+    'traderjoes': SiteAdapter('traderjoes', traderjoes, traderjoes.scrape_categories, 'www.traderjoes.com', concurrency=4),
+}
+
+
+# Crawl the chosen sites at the same time on one browser, so the whole job takes about as long
+# as the slowest site; a summary of every site goes to output/run_summary.json
+async def run_sites(names):
+    adapters = [SITES[name] for name in names]
+    for adapter in adapters:
+        adapter.apply_budget()
+
+    start = time.monotonic()
+    browser = await open_browser()
+    try:
+        results = await asyncio.gather(*(adapter.run(browser) for adapter in adapters))
+    finally:
+        await release_browser(browser)
+
+    summary = {
+        'seconds': round(time.monotonic() - start, 1),
+        'sites': results,
+        'limiters': LIMITERS.stats(),
+        'http_cache': HTTP_CACHE.report(),
+        'reports': {adapter.name: adapter.reports() for adapter in adapters},
+        'metrics': METRICS.summary(),
+    }
+    os.makedirs('output', exist_ok=True)
+    with open('output/run_summary.json', 'w') as f:
+        json.dump(summary, f, indent=4)
+    METRICS.save()
+    for result in results:
+        print(f"{result['site']}: {result['products']} products in {result['seconds']}s"
+              + (f" (failed: {result['error']})" if result['error'] else ""))
+    print(f"All sites done in {summary['seconds']}s")
+
+
+# Run every site, or only the ones named: python run_all.py [site ...]
+if __name__ == '__main__':
+    names = sys.argv[1:] or list(SITES)
+    unknown = [name for name in names if name not in SITES]
+    if unknown:
+        sys.exit(f"Unknown site(s) {unknown}; choose from {list(SITES)}")
+    asyncio.run(run_sites(names))
@@ -0,0 +1,76 @@
+import time
+from lxml import etree
+from cssselect import HTMLTranslator
+
+_css_translator = HTMLTranslator()
+
+
+# One selector compiled once with lxml, plus its evaluation time and hit/miss counters
+class CompiledSelector:
+    def __init__(self, name, field):
+        self.name = name
+        if field.get('xpath'):
+            self.expression = field['xpath']
+        else:
+            self.expression = _css_translator.css_to_xpath(field['css'])
+            if field.get('attr'):
+                self.expression += f"/@{field['attr']}"
+        self.xpath = etree.XPath(self.expression)
+        self.calls = 0
+        self.hits = 0
+        self.misses = 0
+        self.evaluations = 0  # calls timed in Python (the in-page path is timed as a whole)
+        self.seconds = 0.0
+
+    # Evaluate against an already parsed lxml tree; text and attribute results come back as
+    # strings, elements as their text content
+    def evaluate(self, root):
+        start = time.perf_counter()
+        nodes = self.xpath(root)
+        values = [str(node) if isinstance(node, str) else node.text_content() for node in nodes]
+        self.seconds += time.perf_counter() - start
+        self.evaluations += 1
+        self.record_result(values)
+        return values
+
+    # Count a result produced elsewhere (e.g. by the in-page extractor) as a hit or a miss
+    def record_result(self, value):
+        self.calls += 1
+        if value:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+
+# Per-site registry of compiled selectors. Each scraper builds its field specs through spec() once,
+# at import; they carry their compiled selector, so the parsel/HTTP path never re-parses an
+# expression. report() shows the time spent and the hit rate per selector, so a selector whose
+# hit rate drops points at markup that moved.
+class SelectorRegistry:
+    def __init__(self, site):
+        self.site = site
+        self.selectors = {}
+
+    # Compile every field of a page spec under "<page>.<field>" and return the spec with the
+    # compiled selectors attached
+    def spec(self, page_kind, fields):
+        compiled = {}
+        for name, field in fields.items():
+            selector = CompiledSelector(f"{page_kind}.{name}", field)
+            self.selectors[selector.name] = selector
+            compiled[name] = dict(field, selector=selector)
+        return compiled
+
+    # Slowest selectors first, so the ones dominating parse cost are on top
+    def report(self):
+        rows = []
+        for selector in sorted(self.selectors.values(), key=lambda s: s.seconds, reverse=True):
+            rows.append({
+                'selector': selector.name,
+                'calls': selector.calls,
+                'hit_rate': round(selector.hits / selector.calls, 3) if selector.calls else None,
+                'misses': selector.misses,
+                'total_ms': round(selector.seconds * 1000, 3),
+                'avg_us': round(selector.seconds * 1e6 / selector.evaluations, 1) if selector.evaluations else None,
+            })
+        return {'site': self.site, 'selectors': rows}
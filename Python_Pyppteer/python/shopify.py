@@ -0,0 +1,143 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+from http_client import get_json
+
+# products.json returns at most 250 products per page
+PRODUCTS_PAGE_LIMIT = 250
+
+
+# Shopify themes embed the full product (every variant's id, price, availability and image)
+# as JSON in the product page. Debut-style themes use this script tag.
+PRODUCT_JSON_XPATH = '//script[@type="application/json" and starts-with(@id, "ProductJson")]/text()'
+
+
+# Turn a protocol-relative Shopify CDN url into an absolute one
+def absolute_url(src):
+    if not src:
+        return None
+    return f"https:{src}" if src.startswith("//") else src
+
+
+# Embedded product JSON carries prices in cents, products.json carries them as "180.00" strings
+def variant_price(value):
+    if value is None or value == "":
+        return 0.0
+    if isinstance(value, str):
+        return round(float(value.replace(",", "")), 2)
+    return round(value / 100.0, 2)
+
+
+# Decode the embedded product JSON text, or None if the theme doesn't ship it
+def load_product_json(raw):
+    if not raw:
+        return None
+    try:
+        return json.loads(raw)
+    except ValueError as e:
+        print(f"Warning: Could not decode embedded product JSON: {str(e)}")
+        return None
+
+
+# Find which variant option (option1/option2/...) holds the size and which holds the color
+def find_option_keys(product_json):
+    names = []
+    for option in product_json.get('options') or []:
+        # `product | json` gives plain names, products/<handle>.json gives {"name": ...} dicts
+        name = option.get('name') if isinstance(option, dict) else option
+        names.append((name or "").lower())
+
+    size_key = color_key = None
+    for position, name in enumerate(names, start=1):
+        if 'size' in name and not size_key:
+            size_key = f"option{position}"
+        elif ('color' in name or 'colour' in name) and not color_key:
+            color_key = f"option{position}"
+
+    # Same layout the page's dropdowns use: SingleOptionSelector-0 is size, -1 is color
+    return size_key or 'option1', color_key or 'option2'
+
+
+# Build the `models` list (one entry per color, one variant per size) from the product JSON in a single pass
+def build_models(product_json):
+    size_key, color_key = find_option_keys(product_json)
+    default_image = absolute_url(product_json.get('featured_image'))
+
+    models = []
+    models_by_color = {}
+    for variant in product_json.get('variants') or []:
+        color = variant.get(color_key)
+        size = variant.get(size_key)
+        if not color or not size:
+            continue
+
+        featured_image = variant.get('featured_image') or {}
+        image = absolute_url(featured_image.get('src')) or default_image
+
+        if color not in models_by_color:
+            models_by_color[color] = {'color': color, 'variants': []}
+            models.append(models_by_color[color])
+        models_by_color[color]['variants'].append({
+            'id': str(variant['id']) if variant.get('id') is not None else None,
+            'price': variant_price(variant.get('price')),
+            'image': image or "N/A",
+            'size': size
+        })
+
+    return models
+
+
+# Collection handle from a collection url, e.g. .../collections/men-unisex -> men-unisex
+def collection_handle(collection_url):
+    return collection_url.rstrip('/').split('/')[-1]
+
+
+# Product handle from a product url; the same product listed under different collections
+# (.../collections/<c>/products/<handle>) gets the same handle
+def product_handle(product_url):
+    path = urlsplit(product_url).path.rstrip('/')
+    return path.split('/products/')[-1] if '/products/' in path else path
+
+
+# Cheap listing-level data of a products.json product, fingerprinted by incremental crawls
+def listing_summary(product):
+    images = product.get('images') or []
+    return {
+        'title': product.get('title'),
+        'updated_at': product.get('updated_at'),
+        'prices': sorted(str(variant.get('price')) for variant in product.get('variants') or []),
+        'image': images[0].get('src') if images else None,
+    }
+
+
+# Page through /collections/<handle>/products.json and return the collection's product urls
+# (and, when a `summaries` dict is passed, fill it with each url's listing_summary)
+def discover_collection(http, base_url, handle, limit=PRODUCTS_PAGE_LIMIT, max_pages=100, cache=None, summaries=None):
+    product_urls = []
+    for page_number in range(1, max_pages + 1):
+        data = get_json(http, f"{base_url}/collections/{handle}/products.json",
+                        fields={'limit': limit, 'page': page_number}, cache=cache)
+        products = (data or {}).get('products') or []
+        if not products:
+            break
+        # Same url shape the collection pages link to, so product ids and urls match the browser path
+        for product in products:
+            product_url = f"{base_url}/collections/{handle}/products/{product['handle']}"
+            product_urls.append(product_url)
+            if summaries is not None:
+                summaries[product_url] = listing_summary(product)
+        if len(products) < limit:
+            break
+    print(f"Discovered {len(product_urls)} products in collection {handle}")
+    return product_urls
+
+
+# Discover every category concurrently over the shared pool; returns {category name: [product urls]}
+def discover_catalog(http, base_url, categories, workers=4, cache=None, summaries=None):
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            category['name']: executor.submit(discover_collection, http, base_url, collection_handle(category['url']),
+                                              cache=cache, summaries=summaries)
+            for category in categories
+        }
+        return {name: future.result() for name, future in futures.items()}
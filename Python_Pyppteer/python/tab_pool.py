@@ -0,0 +1,125 @@
+import asyncio
+
+# Sentinel telling a worker tab to shut down, queued after every job
+_STOP = object()
+_LAST = float('inf')
+
+
+# Bounded pool of browser tabs draining a shared asyncio queue.
+# Every job gets a submission index so results come back in the order they were queued,
+# no matter which tab finished first. With `on_result` they are streamed out in that order
+# as soon as the ones before them are done, instead of being collected for join().
+# With a `recycler` (page_lifecycle.PageRecycler) tabs are opened through it and swapped for
+# fresh ones between jobs once they have navigated too often or grown too heavy.
+# With `validate`, a job whose result it rejects is queued again under its own index. The queue
+# hands out the lowest index first, so it is retried next, before the results after it pile up.
+class TabPool:
+    def __init__(self, browser, worker, concurrency=4, setup_page=None, on_result=None, recycler=None,
+                 validate=None):
+        self.browser = browser
+        self.worker = worker  # async callable: worker(page, job) -> result
+        self.setup_page = setup_page  # optional async callable run on every new tab
+        self.on_result = on_result  # optional async callable: on_result(result)
+        self.recycler = recycler
+        self.validate = validate  # optional callable: validate(job, result) -> True to run the job again
+        self.concurrency = max(1, int(concurrency))
+        self.queue = None
+        self.results = {}
+        self.submitted = 0
+        self.next_emit = 0
+        self.emit_lock = None
+        self.tasks = []
+
+    # Open the tabs and start one worker per tab
+    async def start(self):
+        self.queue = asyncio.PriorityQueue()
+        self.emit_lock = asyncio.Lock()
+        for worker_id in range(self.concurrency):
+            page = await self._new_page()
+            self.tasks.append(asyncio.ensure_future(self._run(worker_id, page)))
+        print(f"Tab pool started with {self.concurrency} tabs")
+        return self
+
+    async def _new_page(self):
+        if self.recycler:
+            return await self.recycler.new_page(self.browser)
+        page = await self.browser.newPage()
+        if self.setup_page:
+            await self.setup_page(page)
+        return page
+
+    # Queue a job and return its submission index
+    async def put(self, job):
+        index = self.submitted
+        self.submitted += 1
+        await self.queue.put((index, job))
+        return index
+
+    async def _run(self, worker_id, page):
+        try:
+            while True:
+                item = await self.queue.get()
+                try:
+                    index, job = item
+                    if job is _STOP:
+                        return
+                    try:
+                        result = await self.worker(page, job)
+                    except Exception as e:
+                        print(f"Tab {worker_id} failed on job {job}: {str(e)}")
+                        result = None
+                    if self.validate and self.validate(job, result):
+                        await self.queue.put((index, job))  # Queued before task_done, so join() waits for it
+                    else:
+                        self.results[index] = result
+                        if self.on_result:
+                            await self._emit()
+                    if self.recycler:
+                        page = await self.recycler.maybe_recycle(page)
+                finally:
+                    self.queue.task_done()
+        finally:
+            if self.recycler:
+                await self.recycler.close_page(page)
+            else:
+                try:
+                    await page.close()
+                except Exception as e:
+                    print(f"Failed to close tab {worker_id}: {str(e)}")
+
+    # Hand every finished result that has no unfinished job before it to on_result
+    async def _emit(self):
+        async with self.emit_lock:
+            while self.next_emit in self.results:
+                result = self.results.pop(self.next_emit)
+                self.next_emit += 1
+                try:
+                    await self.on_result(result)
+                except Exception as e:
+                    print(f"Failed to handle result {self.next_emit - 1}: {str(e)}")
+
+    # Wait for every queued job and return the results in submission order
+    # (empty when results are streamed through on_result)
+    async def join(self):
+        await self.queue.join()
+        ordered = [self.results[index] for index in sorted(self.results)]
+        self.results = {}
+        return ordered
+
+    # Stop the workers and close their tabs
+    async def close(self):
+        for _ in self.tasks:
+            await self.queue.put((_LAST, _STOP))
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+
+# Run a fixed list of jobs through a temporary tab pool
+async def run_tab_pool(browser, jobs, worker, concurrency=4, setup_page=None):
+    pool = await TabPool(browser, worker, concurrency, setup_page).start()
+    try:
+        for job in jobs:
+            await pool.put(job)
+        return await pool.join()
+    finally:
+        await pool.close()
@@ -0,0 +1,116 @@
+import json
+import os
+import tempfile
+import unittest
+from crawl_state import CrawlJournal
+from fixture_server import start_fixture_server
+from foreignfortune import discovered_over_http
+from http_cache import HttpCache
+from http_client import make_pool
+from shopify import discover_catalog, discover_collection
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+def products_page(*handles):
+    return {'products': [{'handle': handle, 'title': handle.title(), 'updated_at': '2024-05-01',
+                          'variants': [{'price': '10.00'}], 'images': [{'src': f"//cdn/{handle}.jpg"}]}
+                         for handle in handles]}
+
+
+# products.json discovery against a fixture_server serving pages written per test (limit=2 per page)
+class DiscoverCollectionTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.server, self.base_url = start_fixture_server(self.directory.name)
+        self.http = make_pool()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.directory.cleanup()
+
+    # Write collections/<handle>/products.json (page 1) and products.page<n>.json (later pages);
+    # a page given as a str is written as is
+    def collection(self, handle, *pages):
+        folder = os.path.join(self.directory.name, 'collections', handle)
+        os.makedirs(folder, exist_ok=True)
+        for page_number, page in enumerate(pages, start=1):
+            name = 'products.json' if page_number == 1 else f"products.page{page_number}.json"
+            with open(os.path.join(folder, name), 'w') as f:
+                f.write(page if isinstance(page, str) else json.dumps(page))
+
+    def requests_served(self):
+        with self.server.stats_lock:
+            return self.server.stats['responses']
+
+    def discover(self, handle, **kwargs):
+        return discover_collection(self.http, self.base_url, handle, limit=2, **kwargs)
+
+    def test_pages_until_a_short_page(self):
+        self.collection('shirts', products_page('a', 'b'), products_page('c', 'd'), products_page('e'))
+        summaries = {}
+        urls = self.discover('shirts', summaries=summaries)
+        self.assertEqual(urls, [f"{self.base_url}/collections/shirts/products/{handle}" for handle in 'abcde'])
+        self.assertEqual(self.requests_served(), 3)  # The short third page ends it, no fourth request
+        self.assertEqual(summaries[urls[0]], {'title': 'A', 'updated_at': '2024-05-01', 'prices': ['10.00'],
+                                              'image': '//cdn/a.jpg'})
+
+    def test_stops_on_an_empty_page(self):
+        self.collection('hats', products_page('a', 'b'), products_page())
+        self.assertEqual(len(self.discover('hats')), 2)
+        self.assertEqual(self.requests_served(), 2)
+
+    def test_missing_later_page_keeps_earlier_pages(self):
+        self.collection('coats', products_page('a', 'b'), products_page('c', 'd'))
+        self.assertEqual(len(self.discover('coats')), 4)
+        with self.server.stats_lock:
+            self.assertEqual(self.server.stats['errors'], 1)  # Page 3 is a 404
+
+    def test_invalid_json_on_a_later_page_keeps_earlier_pages(self):
+        self.collection('kids', products_page('a', 'b'), '{"products": [')
+        self.assertEqual(len(self.discover('kids')), 2)
+
+    def test_cached_pages_need_no_request(self):
+        self.collection('women', products_page('a'))
+        cache = HttpCache(os.path.join(self.directory.name, 'cache'))
+        cache.configure('127.0.0.1', max_age=600)
+        self.assertEqual(self.discover('women', cache=cache), self.discover('women', cache=cache))
+        self.assertEqual(self.requests_served(), 1)
+
+    def test_empty_collection_falls_back_to_the_browser_walk(self):
+        self.collection('shirts', products_page('a'))
+        self.collection('empty', products_page())
+        categories = [{'name': name, 'url': f"{self.base_url}/collections/{handle}"}
+                      for name, handle in (('Shirts', 'shirts'), ('Empty', 'empty'), ('Missing', 'missing'))]
+        discovered = discover_catalog(self.http, self.base_url, categories)
+        self.assertEqual({name: len(urls) for name, urls in discovered.items()}, {'Shirts': 1, 'Empty': 0, 'Missing': 0})
+
+        # foreignfortune.main journals what was discovered; categories without products are walked in the browser
+        journal = CrawlJournal(os.path.join(self.directory.name, 'test.journal')).open()
+        try:
+            for name, urls in discovered.items():
+                journal.add_pending(name, urls)
+            self.assertTrue(discovered_over_http(journal, 'Shirts'))
+            self.assertFalse(discovered_over_http(journal, 'Empty'))
+            self.assertFalse(discovered_over_http(journal, 'Missing'))
+        finally:
+            journal.close()
+
+
+# The recorded Foreign Fortune collections in fixtures/ (one page each)
+class RecordedCatalogTest(unittest.TestCase):
+    def test_discovers_every_recorded_collection(self):
+        server, base_url = start_fixture_server(os.path.join(FIXTURES_DIR, 'foreignfortune'))
+        try:
+            urls = discover_collection(make_pool(), base_url, 'coats-hats')
+        finally:
+            server.shutdown()
+            server.server_close()
+        handles = sorted(name[:-len('.html')] for name in
+                         os.listdir(os.path.join(FIXTURES_DIR, 'foreignfortune', 'collections', 'coats-hats', 'products')))
+        self.assertEqual(sorted(url.rsplit('/', 1)[-1] for url in urls), handles)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+from fixture_server import start_fixture_server
+from traderjoes_api import TraderJoesApi, map_product, sku_from_url
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+# SKUs in the recorded fixtures/traderjoes/api/graphql.post.json
+KNOWN_SKUS = ('064011', '074573')
+
+
+# TraderJoesApi against the recorded GraphQL response, served by fixture_server
+class TraderJoesApiTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.server, self.base_url = start_fixture_server(FIXTURES_DIR)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def requests_served(self):
+        with self.server.stats_lock:
+            return self.server.stats['responses']
+
+    def api(self, path='/traderjoes/api/graphql', **kwargs):
+        return TraderJoesApi(api_url=f"{self.base_url}{path}", **kwargs)
+
+    async def test_concurrent_lookups_share_one_request(self):
+        api = self.api()
+        items = await asyncio.gather(*(api.product(sku) for sku in KNOWN_SKUS + KNOWN_SKUS))
+        self.assertEqual([item['sku'] for item in items], list(KNOWN_SKUS + KNOWN_SKUS))
+        self.assertEqual(api.batches, 1)
+        self.assertEqual(self.requests_served(), 1)
+
+    async def test_full_batch_is_sent_without_waiting(self):
+        api = self.api(batch_size=2, delay=60)
+        items = await asyncio.wait_for(asyncio.gather(*(api.product(sku) for sku in KNOWN_SKUS)), timeout=5)
+        self.assertEqual([item['item_title'] for item in items], ['Organic Hibiscus Tea', 'Mini Sunflower Bouquet'])
+
+    async def test_prefetched_skus_fill_batches(self):
+        api = self.api(batch_size=3)
+        api.prefetch(['064011', '074573', '000001', '000002', None, '000003'])
+        self.assertEqual(api.waiting, ['000002', '000003'])  # The first three went out as one batch
+        item = await api.product('064011')  # Waits for the batch it is already in
+        self.assertEqual(item['sku'], '064011')
+        self.assertIsNone(await api.product('000003'))
+        self.assertEqual(api.batches, 2)
+        self.assertEqual(self.requests_served(), 2)
+
+    async def test_captured_skus_need_no_request(self):
+        api = self.api()
+        await api.product('064011')
+        api.prefetch(['064011'])
+        self.assertEqual(api.waiting, [])
+        self.assertEqual((await api.product('064011'))['sku'], '064011')
+        self.assertEqual(self.requests_served(), 1)
+
+    async def test_unknown_sku_resolves_to_none(self):
+        api = self.api()
+        self.assertIsNone(await api.product('000000'))
+        self.assertIsNone(await api.product('000000'))  # Remembered: the page is scraped instead
+        self.assertEqual(self.requests_served(), 1)
+
+    async def test_http_error_resolves_every_sku_to_none(self):
+        api = self.api(path='/traderjoes/api/missing')
+        items = await asyncio.gather(*(api.product(sku) for sku in KNOWN_SKUS))
+        self.assertEqual(items, [None, None])
+        self.assertEqual(api.batches, 0)
+        with self.server.stats_lock:
+            self.assertEqual(self.server.stats['errors'], 1)
+
+    async def test_error_payload_resolves_to_none(self):
+        with tempfile.TemporaryDirectory() as directory:
+            os.makedirs(os.path.join(directory, 'api'))
+            with open(os.path.join(directory, 'api', 'graphql.post.json'), 'w') as f:
+                json.dump({'errors': [{'message': 'Internal server error'}]}, f)
+            server, base_url = start_fixture_server(directory)
+            try:
+                api = TraderJoesApi(api_url=f"{base_url}/api/graphql")
+                self.assertIsNone(await api.product('064011'))
+            finally:
+                server.shutdown()
+                server.server_close()
+
+    async def test_cancelled_lookup_leaves_the_batch_running(self):
+        api = self.api(delay=0.1)
+        lookup = asyncio.ensure_future(api.product('064011'))
+        other = asyncio.ensure_future(api.product('064011'))
+        await asyncio.sleep(0)
+        lookup.cancel()
+        self.assertEqual((await other)['sku'], '064011')
+
+
+class MapProductTest(unittest.TestCase):
+    def test_sku_from_url(self):
+        self.assertEqual(sku_from_url('https://www.traderjoes.com/home/products/pdp/organic-hibiscus-tea-064011'), '064011')
+        self.assertEqual(sku_from_url('https://www.traderjoes.com/home/products/pdp/organic-hibiscus-tea-064011/'), '064011')
+        self.assertIsNone(sku_from_url('https://www.traderjoes.com/home/products/pdp/'))
+
+    def test_map_product(self):
+        item = {
+            'sku': '064011',
+            'item_title': 'Organic Hibiscus Tea',
+            'item_description': '<p>Tart and <b>floral</b>.</p><p>Caffeine free.</p>',
+            'retail_price': '2.99',
+            'primary_image_meta': {'url': '/content/dam/tea.png'},
+            'ingredients': [{'ingredient': 'ROSE HIPS', 'sequence_number': 2},
+                            {'ingredient': 'HIBISCUS', 'sequence_number': 1}],
+        }
+        product = map_product(item, 'https://www.traderjoes.com/home/products/pdp/tea-064011', 'beverages')
+        self.assertEqual(product['price'], '$2.99')
+        self.assertEqual(product['image'], 'https://www.traderjoes.com/content/dam/tea.png')
+        self.assertEqual(product['details'], ['Tart and', 'floral', '.', 'Caffeine free.'])
+        self.assertEqual(product['ingredients'], ['HIBISCUS', 'ROSE HIPS'])
+
+    def test_map_product_without_optional_fields(self):
+        product = map_product({'item_title': 'Bouquet'}, 'https://www.traderjoes.com/x-1', 'flowers')
+        self.assertIsNone(product['price'])
+        self.assertEqual(product['details'], [])
+        self.assertEqual(product['ingredients'], "NA")
+
+
+if __name__ == '__main__':
+    unittest.main()
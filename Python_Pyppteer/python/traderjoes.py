@@ -1,9 +1,48 @@
 import asyncio
-from pyppeteer import launch
-from parsel import Selector
 from typing import List, Dict
 import json
 import os
+from urllib.parse import quote
+from page_extract import extract_fields
+from selector_registry import SelectorRegistry
+from interception import InterceptionProfile
+from readiness import goto_ready, act_ready, wait_ready
+from rate_limiter import LIMITERS
+from http_cache import HTTP_CACHE
+from output_sink import JsonlSink, stream_path, count_records, export_json_array
+from crawl_state import CrawlJournal
+from tab_pool import TabPool
+from page_lifecycle import PageRecycler
+from dedupe import SeenIndex, normalize_url
+from incremental import IncrementalState
+from validation_stage import ValidationStage
+from launcher import open_browser, release_browser
+from metrics import METRICS, set_site
+from traderjoes_api import TraderJoesApi, sku_from_url, map_product
+
+# Number of browser tabs scraping product pages, and loading listing pages, in parallel
+CONCURRENCY = 4
+LISTING_CONCURRENCY = 3
+
+LIMITERS.configure('www.traderjoes.com', rate=1.0, concurrency=1, max_concurrency=CONCURRENCY + LISTING_CONCURRENCY)
+
+# Products are streamed to output/traderjoes.jsonl (gzipped when True) as they are scraped
+COMPRESS_OUTPUT = False
+
+# The page shells and script bundles are cached on disk and revalidated on every use
+HTTP_CACHE.configure('www.traderjoes.com', max_age=0)
+
+# Stylesheets stay: the pagination arrows are waited on as visible elements
+INTERCEPTION = InterceptionProfile('traderjoes', cache=HTTP_CACHE)
+
+# Where product details come from:
+#   "api"     - ask the GraphQL endpoint for batches of SKUs directly (no product page load)
+#   "capture" - keep the product data the listing and product pages already fetch (SKUs they
+#               missed are asked from the API in batches, so every product is fingerprinted)
+#   "browser" - read the rendered product page only
+# Products the API doesn't return are scraped from the rendered page either way.
+DETAIL_MODE = "api"
+API = TraderJoesApi(limiter=LIMITERS)  # Pass api_url= to replay fixtures (see traderjoes_api.py)
 
 # Ensure the output directory exists
 os.makedirs("output", exist_ok=True)
@@ -13,25 +52,67 @@ categories = {
     "flowers_and_plants": "https://www.traderjoes.com/home/products/category/flowers-and-plants-203",
     "beverages": "https://www.traderjoes.com/home/products/category/beverages-182",
     "everything_else": "https://www.traderjoes.com/home/products/category/everything-else-215",
-    #"food": "https://www.traderjoes.com/home/products/category/food-8"
+    "food": "https://www.traderjoes.com/home/products/category/food-8"
 }
 
-# Function to launch the browser
-async def launch_browser():
-    browser = await launch(
-        headless=False,  # Set to False to see browser interaction
-        executablePath='D:/chromium/chrome.exe',  # Adjust path to your Chromium/Chrome executable
-        args=['--no-sandbox']  # Avoids permission issues in certain environments
-    )
-    return browser
+# When each kind of page is ready to be read (see readiness.py). Listing pages are filled in by
+# a GraphQL request after load, so they also wait for that response and for the grid to settle.
+PRODUCT_CARD_XPATH = "//a[contains(@class, 'Link_link__1AZfr') and contains(@class, 'ProductCard_card__title__301JH')]"
+READINESS = {
+    'listing': {'xpath': PRODUCT_CARD_XPATH, 'response': '/api/graphql', 'settle_ms': 300, 'timeout': 15000},
+    'product': {'xpath': '//h1[contains(@class, "ProductDetails_main__title")]', 'timeout': 20000, 'goto_timeout': 60000},
+}
+
+# Highest page number shown in the pagination bar (the bar elides the middle, never the last page)
+TOTAL_PAGES_JS = """
+() => {
+    let total = 1;
+    document.querySelectorAll('[class*="Pagination_pagination"] button, [class*="Pagination_pagination"] a').forEach(el => {
+        const number = parseInt(el.textContent.trim(), 10);
+        if (!isNaN(number) && number > total) {
+            total = number;
+        }
+    });
+    return total;
+}
+"""
+
+# Products are keyed by SKU (the url's trailing number), so one listed under several categories is
+# scraped once and exported with all of them. mode="bloom" bounds memory for huge frontiers.
+def product_key(product_url: str) -> str:
+    return sku_from_url(product_url) or normalize_url(product_url)
+
+SEEN = SeenIndex(key=product_key, mode="exact")
+
+# Incremental crawl: with DETAIL_MODE = "capture", products whose listing data (title, price,
+# image from the listing's GraphQL response) is unchanged since the last run are carried forward
+# from its output instead of loading their page; set enabled=False to scrape everything again
+INCREMENTAL = IncrementalState('traderjoes', key=product_key, enabled=True)
+
+# Re-fetches (see validation_stage.py) read the rendered product page, skipping the API
+VALIDATOR = ValidationStage("Trader Joe's", max_refetches=2)
+
+# Selectors on the React app's hashed CSS-module classes, the first to break (see selector_registry.py)
+REGISTRY = SelectorRegistry('traderjoes')
+
+# Fields read from each page in one in-page extraction call
+LISTING_FIELDS = REGISTRY.spec('listing', {
+    'product_links': {'xpath': PRODUCT_CARD_XPATH + "/@href", 'all': True},
+})
+PRODUCT_FIELDS = REGISTRY.spec('product', {
+    'title': {'xpath': '//h1[contains(@class, "ProductDetails_main__title")]/text()'},
+    'fallback_title': {'xpath': '//h1/text()'},
+    'price': {'xpath': '//div[contains(@class, "ProductPrice_productPrice")]//span[1]/text()'},
+    'image': {'xpath': '//picture[contains(@class, "HeroImage_heroImage")]//img/@src'},
+    'details': {'xpath': '//div[contains(@class, "ProductDetails_main__description")]//p/text()', 'all': True},
+    'ingredients': {'xpath': "//div[@class='Section_section__oNcdC']//div[contains(@class, 'Section_section__header__R8aD_')]/following-sibling::div/text()", 'all': True},
+})
 
 # Function to extract product links from the current page
 async def extract_product_links(page, current_page_url: str) -> List[str]:
     try:
-        await page.waitForXPath("//a[contains(@class, 'Link_link__1AZfr') and contains(@class, 'ProductCard_card__title__301JH')]", timeout=15000)
-        content = await page.content()
-        sel = Selector(text=content)
-        product_links = sel.xpath("//a[contains(@class, 'Link_link__1AZfr') and contains(@class, 'ProductCard_card__title__301JH')]/@href").getall()
+        await wait_ready(page, {'xpath': PRODUCT_CARD_XPATH, 'timeout': 15000})
+        product_links = (await extract_fields(page, LISTING_FIELDS))['product_links']
         product_links = [f"https://www.traderjoes.com{link}" for link in product_links]
 
         # Debugging statement to show number of products and the current page URL
@@ -42,49 +123,90 @@ async def extract_product_links(page, current_page_url: str) -> List[str]:
         print(f"Error extracting product links from page {current_page_url}: {e}")
         return []
 
+# Every tab blocks heavy resources and, in capture mode, keeps the product data it receives
+async def setup_tab(page):
+    await INTERCEPTION.apply(page)
+    if DETAIL_MODE == "capture":
+        API.capture(page)
+
+# Every tab is opened through the recycler, which swaps a tab for a fresh one after 25 page loads
+# or once its JS heap passes 250 MB (the React pages grow with every navigation)
+RECYCLER = PageRecycler('traderjoes', setup_page=setup_tab, max_navigations=25, max_heap_mb=250)
+
+# Product data from the API (or from a captured response), or None when there is none
+async def product_from_api(product_url: str, category: str):
+    sku = sku_from_url(product_url)
+    if not sku:
+        return None
+    item = await API.product(sku) if DETAIL_MODE == "api" else API.captured.get(sku)
+    return map_product(item, product_url, category) if item else None
+
 # Function to scrape product details, including ingredients
-async def scrape_product_details(page, product_url: str, category: str, retries=3) -> Dict[str, any]:
+async def scrape_product_details(page, product_url: str, category: str, retries=3, detail_mode=None) -> Dict[str, any]:
+    detail_mode = detail_mode or DETAIL_MODE
+    if detail_mode != "browser":
+        product_data = await product_from_api(product_url, category)
+        if product_data:
+            return product_data
+
     for attempt in range(retries):
         try:
-            await page.goto(product_url, timeout=60000)
-            await page.waitForXPath('//h1[contains(@class, "ProductDetails_main__title")]', timeout=20000)
-            content = await page.content()
-            sel = Selector(text=content)
+            await goto_ready(page, product_url, READINESS['product'], LIMITERS)
+            if detail_mode == "capture":
+                product_data = await product_from_api(product_url, category)  # The page's own request
+                if product_data:
+                    return product_data
+            fields = await extract_fields(page, PRODUCT_FIELDS)
 
             # Extract product details
             product_data = {
-                'title': sel.xpath('//h1[contains(@class, "ProductDetails_main__title")]/text()').get() or sel.xpath('//h1/text()').get(),
-                'price': sel.xpath('//div[contains(@class, "ProductPrice_productPrice")]//span[1]/text()').get(),
-                'image': sel.xpath('//picture[contains(@class, "HeroImage_heroImage")]//img/@src').get(),
-                'details': sel.xpath('//div[contains(@class, "ProductDetails_main__description")]//p/text()').getall(),
+                'title': fields['title'] or fields['fallback_title'],
+                'price': fields['price'],
+                'image': fields['image'],
+                'details': fields['details'],
                 'url': product_url,
                 'category': category  # Include category in the product data
             }
 
             # Extract ingredients
-            ingredients = sel.xpath("//div[@class='Section_section__oNcdC']//div[contains(@class, 'Section_section__header__R8aD_')]/following-sibling::div/text()").getall()
+            ingredients = fields['ingredients']
             product_data['ingredients'] = ingredients if ingredients else "NA"  # Set "NA" if no ingredients found
 
-            await asyncio.sleep(1)  # Small sleep between requests
             return product_data
         except Exception as e:
             print(f"Error scraping {product_url}: {e} (Attempt {attempt + 1} of {retries})")
             if attempt < retries - 1:
-                await asyncio.sleep(1)  # Wait before retrying
+                METRICS.count('retries', stage='product')
+                with METRICS.span('backoff'):
+                    await asyncio.sleep(LIMITERS.for_url(product_url).backoff(attempt))  # Back off before retrying
             else:
                 return {}
 
-# Function to scrape all products from the current page's product links
-async def scrape_all_products(page, product_links: List[str], total_products: List[Dict[str, any]], category: str, category_count: Dict[str, int]):
-    for link in product_links:
-        product_details = await scrape_product_details(page, link, category)
-        if product_details:
-            total_products.append(product_details)
-            category_count[category] += 1  # Increment the count for the current category
-            print(f"Scraped product: {product_details['title']}")
-        await asyncio.sleep(1)  # Small delay between products to prevent too many requests
+# Pool worker: scrape one (product_url, category) job from the frontier on the tab it was handed
+async def scrape_product_job(page, job):
+    product_url, category = job
+    if VALIDATOR.refetching(product_url):
+        # The last record failed validation: read the rendered page, past the cache
+        HTTP_CACHE.invalidate(product_url)
+        return await scrape_product_details(page, product_url, category, detail_mode="browser")
+    # The API item is the listing data every product is fingerprinted from (captured ones need no
+    # request, the rest are batched); the browser mode has none and always scrapes the page
+    sku = sku_from_url(product_url)
+    item = await API.product(sku) if sku and DETAIL_MODE != "browser" else None
+    if item:
+        INCREMENTAL.observe(product_url, {'title': item.get('item_title'), 'price': item.get('retail_price'),
+                                          'image': item.get('primary_image')})
+    if INCREMENTAL.is_unchanged(product_url):
+        previous = INCREMENTAL.previous_record(product_url)
+        if previous:
+            return dict(previous, url=product_url, category=category)
+    product_details = await scrape_product_details(page, product_url, category)
+    if product_details:
+        print(f"Scraped product: {product_details['title']}")
+    return product_details
 
 # Function to click the "Next" button on the category page to load the next set of products
+# (only used when page-number urls don't work)
 async def go_to_next_page(page):
     try:
         # Check if 'Next' button is disabled
@@ -96,8 +218,9 @@ async def go_to_next_page(page):
         # Wait for the 'Next' button to be clickable and not disabled
         next_button = await page.waitForXPath("//button[@class='Pagination_pagination__arrow__3TJf0 Pagination_pagination__arrow_side_right__9YUGr']", {'visible': True, 'timeout': 10000})
         if next_button:
-            await next_button.click()
-            await page.waitForNavigation({'waitUntil': 'networkidle0'})  # Wait until the network is idle
+            # Wait for the next page's product data to arrive and the grid to re-render
+            async with LIMITERS.for_url(page.url).slot():
+                await act_ready(page, next_button.click, READINESS['listing'])
             print("Moved to the next page.")
             return True
         else:
@@ -107,61 +230,195 @@ async def go_to_next_page(page):
         print(f"Error moving to the next page: {e}")
         return False
 
-# Function to scrape all products and navigate pages for a given category
-async def scrape_all_pages(page, category_url: str, category: str, total_products: List[Dict[str, any]], category_count: Dict[str, int]):
-    current_page_number = 1  # Track the current page number
+# Listing page k is addressed directly as <category url>?filters={"page":k}
+def listing_page_url(category_url: str, page_number: int) -> str:
+    filters = json.dumps({"page": page_number}, separators=(',', ':'))
+    return f"{category_url}?filters={quote(filters, safe='')}"
 
-    while True:
-        # Get current page URL to return after scraping
-        current_page_url = page.url
-        print(f"Scraping product links from page {current_page_url}")
-
-        # Extract product links from the current page
-        product_links = await extract_product_links(page, current_page_url)
-        if product_links:
-            # Scrape all product details from the current page's product links
-            await scrape_all_products(page, product_links, total_products, category, category_count)
-        
-        # After scraping all products from the current page, return to the saved page URL (before "Next")
-        await page.goto(current_page_url)  # Return to the page before trying to click "Next"
-        print(f"Returned to page {current_page_url}. Ready to click 'Next' button.")
+# Read the total number of listing pages from the page numbers in the pagination bar
+async def detect_total_pages(page) -> int:
+    try:
+        return await page.evaluate(TOTAL_PAGES_JS)
+    except Exception as e:
+        print(f"Failed to detect total pages, defaulting to 1: {e}")
+        return 1
 
-        await asyncio.sleep(1)  # Ensure the page reloads completely
-        
-        # Try clicking the "Next" button to move to the next page
+# Push a listing page's product links onto the frontier and journal them
+async def queue_product_links(pool, journal: CrawlJournal, category: str, page_number: int, product_links: List[str], record_position=True) -> int:
+    journal.add_pending(category, product_links)
+    if record_position:
+        journal.set_position(category, page_number)
+    queued = []
+    for product_url in product_links:
+        if not journal.is_done(product_url) and SEEN.add(product_url, category):
+            queued.append(product_url)
+    if DETAIL_MODE == "api":
+        API.prefetch(sku_from_url(product_url) for product_url in queued)  # Whole pages per API request
+    for product_url in queued:
+        await pool.put((product_url, category))
+    return len(queued)
+
+# Listing pool worker: load one listing page by number and return its product links
+# (None for the links when the page could not be loaded)
+async def listing_page_job(page, job, retries=3):
+    category_url, category, page_number = job
+    url = listing_page_url(category_url, page_number)
+    for attempt in range(retries):
+        try:
+            await goto_ready(page, url, READINESS['listing'], LIMITERS)
+            return category, page_number, await extract_product_links(page, url)
+        except Exception as e:
+            print(f"Error loading listing page {url}: {e} (Attempt {attempt + 1} of {retries})")
+            if attempt < retries - 1:
+                METRICS.count('retries', stage='listing')
+                with METRICS.span('backoff'):
+                    await asyncio.sleep(LIMITERS.for_url(url).backoff(attempt))
+    return category, page_number, None
+
+# Fallback when page-number urls don't work: walk the rest of the listing with the "Next" button
+async def walk_listing_pages(page, pool, category_url: str, category: str, journal: CrawlJournal) -> int:
+    queued = 0
+    await goto_ready(page, category_url, READINESS['listing'], LIMITERS)
+    current_page_number = 1
+    while True:
+        if current_page_number > journal.position(category):
+            product_links = await extract_product_links(page, page.url)
+            queued += await queue_product_links(pool, journal, category, current_page_number, product_links)
         if not await go_to_next_page(page):
             break
-        
-        # Increment the page number for debugging and continue
         current_page_number += 1
+    journal.complete_category(category)
+    return queued
+
+# Listing-discovery phase for one category. Page 1 gives the page count; page 2 is loaded by its
+# page-number url to confirm the addressing works, and every remaining listing page is then handed
+# to the listing pool at once, so discovery takes about as long as the slowest page.
+async def discover_category(page, listing_pool, pool, category_url: str, category: str, journal: CrawlJournal, pages_left: Dict[str, int]) -> int:
+    queued = 0
+
+    # Product urls found by an interrupted run go back on the frontier first
+    for product_url in journal.pending_for(category):
+        if SEEN.add(product_url, category):
+            await pool.put((product_url, category))
+            queued += 1
+    if journal.is_category_complete(category):
+        print(f"Listing already walked for category {category} in an earlier run")
+        return queued
+
+    await goto_ready(page, category_url, READINESS['listing'], LIMITERS)
+    total_pages = await detect_total_pages(page)
+    first_links = await extract_product_links(page, page.url)
+    print(f"Category {category} has {total_pages} listing pages")
+    if journal.position(category) < 1:
+        queued += await queue_product_links(pool, journal, category, 1, first_links)
 
-# Main function to scrape all categories
-async def scrape_categories():
-    browser = await launch(headless=False, executablePath='/usr/bin/google-chrome')
-    page = await browser.newPage()
+    if total_pages > 1:
+        url = listing_page_url(category_url, 2)
+        await goto_ready(page, url, READINESS['listing'], LIMITERS)
+        second_links = await extract_product_links(page, url)
+        if not second_links or set(second_links) == set(first_links):
+            print(f"Page-number urls don't work for {category}, walking the listing with the Next button")
+            return queued + await walk_listing_pages(page, pool, category_url, category, journal)
+        if journal.position(category) < 2:
+            queued += await queue_product_links(pool, journal, category, 2, second_links)
+
+    remaining = range(max(3, journal.position(category) + 1), total_pages + 1)
+    if not remaining:
+        journal.complete_category(category)
+        return queued
+    pages_left[category] = len(remaining)
+    for page_number in remaining:
+        await listing_pool.put((category_url, category, page_number))
+    return queued
+
+# Main function to scrape all categories (`browser`: see launcher.open_browser); returns the product count
+async def scrape_categories(browser=None, report=True):
+    set_site('traderjoes')
+    own_browser = browser is None
+    if own_browser:
+        browser = await open_browser()
+    page = await RECYCLER.new_page(browser)
     
-    total_products = []  # Store all products from all categories
-    category_count = {category: 0 for category in categories.keys()}  # Initialize count per category
+    # The journal records discovered urls, listing positions, walked categories and finished products,
+    # so a restarted run picks up where the last one stopped and appends to its stream
+    journal = CrawlJournal('output/traderjoes.journal').open()
+    SEEN.restore(journal)
+    INCREMENTAL.begin(stream_path('traderjoes', COMPRESS_OUTPUT), resumed=journal.resumed).restore(journal)
+    sink = await JsonlSink(stream_path('traderjoes', COMPRESS_OUTPUT), append=journal.resumed).open()  # Every product is written as soon as it is scraped
+
+    def product_written(product):
+        journal.mark_done(product['url'], INCREMENTAL.written_record(product['url']))
+
+    async def write_product(product):
+        if product:
+            await sink.write(product, on_written=lambda: product_written(product))
+
+    # Detail workers drain the frontier while the listing pages are loaded; products failing
+    # validation are re-queued ahead of it
+    pool = await TabPool(browser, scrape_product_job, concurrency=CONCURRENCY, on_result=write_product,
+                         recycler=RECYCLER, validate=lambda job, product: VALIDATOR.needs_refetch(job[0], product)).start()
+
+    # Listing pages come back in page order; a category is walked once its last page is queued.
+    # After a page fails, later pages stop advancing the journal position so a rerun fetches it again.
+    pages_left = {}
+    failed_categories = set()
 
+    async def queue_listing_page(result):
+        category, page_number, product_links = result
+        if product_links is None:
+            failed_categories.add(category)
+        else:
+            await queue_product_links(pool, journal, category, page_number, product_links,
+                                      record_position=category not in failed_categories)
+        pages_left[category] -= 1
+        if pages_left[category] == 0 and category not in failed_categories:
+            journal.complete_category(category)
+
+    listing_pool = await TabPool(browser, listing_page_job, concurrency=LISTING_CONCURRENCY,
+                                 on_result=queue_listing_page, recycler=RECYCLER).start()
     for category, url in categories.items():
-        print(f"Starting scraping for category: {category}")
-        await page.goto(url)
-        await scrape_all_pages(page, url, category, total_products, category_count)
-    
-    # Save the scraped data to a JSON file
-    with open('output/traderjoes.json', 'w') as f:
-        json.dump(total_products, f, indent=4)
+        print(f"Starting discovery for category: {category}")
+        await discover_category(page, listing_pool, pool, url, category, journal, pages_left)
+        page = await RECYCLER.maybe_recycle(page)
+
+    await listing_pool.join()
+    await listing_pool.close()
+    await pool.join()
+    await pool.close()
+    await sink.close()
+    journal.finish()
+    INCREMENTAL.finish()
+    HTTP_CACHE.save()
+    METRICS.save()
+
+    # Export the stream as the pretty JSON array
+    export_json_array(sink.path, 'output/traderjoes.json', transform=SEEN.with_categories)
 
-    # Save the product count details to a text file
-    total_count = sum(category_count.values())
+    # Save the product count details, derived from the stream, to a text file
+    total_count, streamed_count = count_records(sink.path, key='category')
     with open('output/traderjoes_count.txt', 'w') as f:
-        for category, count in category_count.items():
-            f.write(f"{category}: {count} products\n")
+        for category in categories.keys():
+            f.write(f"{category}: {streamed_count[category]} products\n")
         f.write(f"\nTotal products scraped across all categories: {total_count}\n")
     
-    await browser.close()
+    await RECYCLER.close_page(page)
+    if own_browser:
+        await release_browser(browser)
+        print("Browser released.")
+    if report:
+        print(json.dumps(INTERCEPTION.report(), indent=4))
+        print(json.dumps(LIMITERS.stats(), indent=4))
+        print(json.dumps(REGISTRY.report(), indent=4))
+        print(json.dumps(RECYCLER.report(), indent=4))
+        print(json.dumps(SEEN.stats(), indent=4))
+        print(json.dumps(HTTP_CACHE.report(), indent=4))
+        print(json.dumps(INCREMENTAL.report(), indent=4))
+        print(json.dumps(VALIDATOR.report(), indent=4))
+        print(json.dumps(METRICS.summary()['sites'].get('traderjoes', {}), indent=4))
+    print(f"Product API: {API.batches} batched requests, {len(API.captured)} SKUs known")
     print(f"Total {total_count} products scraped across all categories.")
-    print("Browser closed.")
+    return total_count
 
 # Run the scraper
-asyncio.run(scrape_categories())
+if __name__ == '__main__':
+    asyncio.run(scrape_categories())
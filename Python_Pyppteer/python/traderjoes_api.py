@@ -0,0 +1,180 @@
+import asyncio
+import json
+import re
+import sys
+from parsel import Selector
+from http_client import make_pool, post_json
+from fixture_server import start_fixture_server
+from metrics import METRICS
+
+# The product pages are a React app filled in from this GraphQL endpoint
+API_URL = "https://www.traderjoes.com/api/graphql"
+SITE_URL = "https://www.traderjoes.com"
+
+# Same fields the product page asks for, for a batch of SKUs at once
+SEARCH_PRODUCTS_QUERY = """
+query SearchProducts($skus: [String], $storeCode: String = "TJ", $published: String = "1") {
+  products(filter: {sku: {in: $skus}, store_code: {eq: $storeCode}, published: {eq: $published}}, pageSize: 100) {
+    items {
+      sku
+      item_title
+      item_description
+      retail_price
+      sales_size
+      sales_uom_description
+      primary_image
+      primary_image_meta { url }
+      ingredients { key ingredient sequence_number }
+    }
+    total_count
+  }
+}
+"""
+
+
+# SKU is the trailing number of a product url, e.g. .../pdp/organic-hibiscus-tea-064011 -> 064011
+def sku_from_url(product_url):
+    match = re.search(r'-(\d+)/?$', product_url)
+    return match.group(1) if match else None
+
+
+# Product items inside a GraphQL payload, or [] when it carries something else
+def items_from_payload(payload):
+    try:
+        return payload['data']['products']['items'] or []
+    except (KeyError, TypeError):
+        return []
+
+
+# Map an API product item onto the dict shape scrape_product_details produces from the page
+def map_product(item, product_url, category):
+    image = (item.get('primary_image_meta') or {}).get('url') or item.get('primary_image')
+    if image and image.startswith('/'):
+        image = f"{SITE_URL}{image}"
+
+    description = item.get('item_description') or ""
+    details = [text.strip() for text in Selector(text=f"<div>{description}</div>").xpath('//text()').getall() if text.strip()]
+
+    ingredients = sorted(item.get('ingredients') or [], key=lambda entry: entry.get('sequence_number') or 0)
+    ingredients = [entry['ingredient'] for entry in ingredients if entry.get('ingredient')]
+
+    price = item.get('retail_price')
+    return {
+        'title': item.get('item_title'),
+        'price': f"${price}" if price else None,  # Same "$x.xx" text the page shows
+        'image': image,
+        'details': details,
+        'url': product_url,
+        'category': category,
+        'ingredients': ingredients if ingredients else "NA"
+    }
+
+
+# Product data straight from the GraphQL endpoint. SKUs are collected for `delay` seconds (or
+# until `batch_size` are waiting) and sent as one request. The listing queues every SKU it finds
+# (prefetch) as soon as a page is parsed, so batches fill up; a worker's lookup then waits for the
+# batch its SKU is already in.
+class TraderJoesApi:
+    def __init__(self, api_url=API_URL, http=None, limiter=None, batch_size=20, delay=0.05):
+        self.api_url = api_url
+        self.http = http or make_pool()
+        self.limiter = limiter
+        self.batch_size = batch_size
+        self.delay = delay
+        self.waiting = []  # SKUs for the next batch
+        self.pending = {}  # SKU -> future of its batch, queued or in flight
+        self.flush_handle = None
+        self.captured = {}
+        self.batches = 0
+
+    # API item for one SKU, or None when the API doesn't know it (callers fall back to the page)
+    async def product(self, sku):
+        if sku in self.captured:
+            return self.captured[sku]
+        return await asyncio.shield(self._queue(sku))  # Other lookups share the future
+
+    # Queue SKUs for the next batches without waiting for them (unknown and captured ones are skipped)
+    def prefetch(self, skus):
+        for sku in skus:
+            if sku and sku not in self.captured:
+                self._queue(sku)
+
+    def _queue(self, sku):
+        future = self.pending.get(sku)
+        if future is None:
+            future = self.pending[sku] = asyncio.get_event_loop().create_future()
+            self.waiting.append(sku)
+            if len(self.waiting) >= self.batch_size:
+                self._flush_now()
+            elif self.flush_handle is None:
+                self.flush_handle = asyncio.get_event_loop().call_later(self.delay, self._flush_now)
+        return future
+
+    def _flush_now(self):
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        batch, self.waiting = self.waiting, []
+        if batch:
+            asyncio.ensure_future(self._fetch_batch(batch))
+
+    async def _fetch_batch(self, batch):
+        payload = {
+            'operationName': 'SearchProducts',
+            'variables': {'skus': batch},
+            'query': SEARCH_PRODUCTS_QUERY,
+        }
+        items = {}
+        try:
+            loop = asyncio.get_event_loop()
+            if self.limiter is None:
+                with METRICS.span('api'):
+                    response = await loop.run_in_executor(None, post_json, self.http, self.api_url, payload)
+            else:
+                async with self.limiter.for_url(self.api_url).slot():
+                    with METRICS.span('api'):
+                        response = await loop.run_in_executor(None, post_json, self.http, self.api_url, payload)
+            for item in items_from_payload(response):
+                items[item.get('sku')] = item
+            self.batches += 1
+        except Exception as e:
+            print(f"Product API request failed for {len(batch)} SKUs: {str(e)}")
+        for sku in batch:
+            self.captured[sku] = items.get(sku)
+            future = self.pending.pop(sku, None)
+            if future is not None and not future.done():
+                future.set_result(items.get(sku))
+
+    # Keep every product item a page receives (listing pages included), so a later lookup
+    # needs no request
+    def capture(self, page):
+        async def on_response(response):
+            if '/api/graphql' not in response.url:
+                return
+            try:
+                for item in items_from_payload(await response.json()):
+                    if item.get('sku'):
+                        self.captured[item['sku']] = item
+            except Exception:
+                pass  # Not JSON, or the page navigated away before the body was read
+
+        page.on('response', lambda response: asyncio.ensure_future(on_response(response)))
+
+
+# Replay the recorded payload in fixtures/ through a local server and print the mapped products:
+#   python traderjoes_api.py [sku ...]
+async def replay(skus):
+    server, base_url = start_fixture_server('fixtures')
+    api = TraderJoesApi(api_url=f"{base_url}/traderjoes/api/graphql")
+    try:
+        products = await asyncio.gather(*(api.product(sku) for sku in skus))
+        for sku, item in zip(skus, products):
+            url = f"{SITE_URL}/home/products/pdp/{sku}"
+            print(json.dumps(map_product(item, url, 'replay') if item else {'sku': sku, 'found': False}, indent=4))
+        print(f"{len(skus)} lookups in {api.batches} API request(s)")
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    asyncio.run(replay(sys.argv[1:] or ['064011', '074573', '000000']))
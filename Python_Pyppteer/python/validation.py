@@ -1,164 +1,417 @@
 import re
+import sys
 import json
 import os
+import gzip
+import zlib
+import queue
 import logging
-
-# Ensure the output directory exists
-os.makedirs("validation", exist_ok=True)
+import logging.handlers
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
 
 # Setup the main logger format
 formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
 
-# Helper function to set up individual loggers
+# Background listeners writing each log file, by file name
+_listeners = {}
+
+# Helper function to set up individual loggers. Records go through a queue to a file handler on a
+# background thread, so logging doesn't block validation; calling it again for the same file
+# returns the same logger instead of adding another handler.
 def setup_logger(log_file):
+    logger = logging.getLogger(log_file)
+    if log_file in _listeners:
+        return logger
+    log_queue = queue.SimpleQueue()
     handler = logging.FileHandler(log_file)
     handler.setFormatter(formatter)
-    logger = logging.getLogger(log_file)
+    listener = logging.handlers.QueueListener(log_queue, handler)
+    listener.start()
+    _listeners[log_file] = listener
     logger.setLevel(logging.INFO)
-    logger.addHandler(handler)
+    logger.propagate = False
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
     return logger
 
+# Write out everything still queued and close the log files
+def close_loggers():
+    for log_file, listener in list(_listeners.items()):
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+        logger = logging.getLogger(log_file)
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+        del _listeners[log_file]
+
+def _passed(message):
+    """Rule for a check that does not apply to a site: always passes with its usual message."""
+    return lambda product: (True, message)
+
+def check_sale_price(product):
+    """Ensure that sale price is less than or equal to the original price."""
+    original_prices = product.get("prices", [])
+    sale_prices = product.get("sale_prices", [])
+
+    if not sale_prices:
+        return True, "No sale price, skipping sale price validation."
+    if not original_prices:
+        return True, "No original prices, skipping sale price validation."
+
+    for sale, original in zip(sale_prices, original_prices):
+        if sale > original:
+            return False, f"Sale price {sale} is greater than the original price {original}."
+    return True, "Sale price validation passed."
+
+def mandatory_fields_rule(mandatory_fields):
+    """Build a rule checking that every field in `mandatory_fields` is present and non-empty."""
+    mandatory_fields = tuple(mandatory_fields)
+
+    def check_mandatory_fields(product):
+        for field in mandatory_fields:
+            if not product.get(field):
+                return False, f"Missing mandatory field: {field}"
+        return True, "Mandatory fields validation passed."
+    return check_mandatory_fields
+
+def check_variants(product):
+    """Ensure that each product variant has images and prices."""
+    models = product.get("models", [])
+    if not models:
+        return False, "No models found."
+
+    for model in models:
+        for variant in model.get("variants", []):
+            if variant.get("image") in (None, "", "N/A") or not variant.get("price"):
+                return False, f"Variant missing image or price: {variant}"
+    return True, "Variant validation passed."
+
+def check_numeric_price(product):
+    """Check that the `price` value and every entry of `prices` are positive numbers."""
+    price = product.get("price", None)
+    prices = product.get("prices", [])
+
+    # Handle if `price` is a single value; a placeholder such as "N/A" means it wasn't found
+    if isinstance(price, str):
+        return False, f"Price is not a number: {price}"
+    if price is not None and isinstance(price, (int, float)):
+        if price <= 0:
+            return False, f"Invalid price: {price}. Price must be positive."
+
+    # Handle `prices` list if present
+    if prices:
+        for p in prices:
+            if p <= 0:
+                return False, f"Invalid price in list: {p}. Price must be positive."
+    elif price is None and not prices:
+        return False, "Prices are missing."
+    return True, "Price validation passed."
+
+def check_price_text(product):
+    """Check that a price string such as "$3.49" parses to a positive number."""
+    price_str = product.get("price", "")
+    try:
+        price = float(price_str.replace("$", "").replace(",", "").strip())
+        if price <= 0:
+            return False, f"Invalid price: {price}. Price must be positive."
+    except (ValueError, AttributeError):
+        return False, "Price parsing failed."
+    return True, "Price validation passed."
+
+_URL_PATTERN = re.compile(r'https?://')
+
+def check_url(product):
+    """Check that the product URL is valid."""
+    url = product.get("url", "")
+    if not isinstance(url, str) or not _URL_PATTERN.match(url):
+        return False, f"Invalid URL: {url}"
+    return True, "URL validation passed."
+
+def check_weight(product):
+    """Ensure that the product has a valid weight, when it has one."""
+    weight = product.get("weight", None)
+    if weight is None or weight == 0:
+        return True, "No weight provided, skipping validation."
+    if isinstance(weight, (int, float)) and weight < 0:
+        return False, f"Invalid weight: {weight}. Weight must be positive."
+    return True, "Weight validation passed."
+
+# Rules per site, built once: validating a product runs its site's rules without looking at the
+# website name again. Every site has the same rule names, in the order they are reported.
+RULESETS = {
+    "Foreign Fortune": {
+        'sale_price': check_sale_price,
+        'mandatory_fields': mandatory_fields_rule(['title', 'product_id', 'models', 'category']),
+        'variants': check_variants,
+        'positive_price': check_numeric_price,
+        'url': check_url,
+        'weight': check_weight,
+    },
+    "Le Chocolat": {
+        'sale_price': _passed("Sale price validation passed."),
+        'mandatory_fields': mandatory_fields_rule(['title', 'title_id', 'price', 'category', 'weight']),
+        'variants': _passed("Variant validation passed."),
+        'positive_price': check_numeric_price,
+        'url': check_url,
+        'weight': check_weight,
+    },
+    "Trader Joe's": {
+        'sale_price': _passed("Sale price validation passed."),
+        'mandatory_fields': mandatory_fields_rule(['title', 'price', 'category', 'ingredients']),
+        'variants': _passed("Variant validation passed."),
+        'positive_price': check_price_text,
+        'url': check_url,
+        'weight': _passed("Weight validation passed."),
+    },
+}
+
+def failed_rules(product, rules):
+    """Run every rule on a product and return (rule name, message) for each one that fails."""
+    failures = []
+    for name, rule in rules.items():
+        try:
+            valid, message = rule(product)
+        except Exception as e:
+            valid, message = False, f"Rule raised {type(e).__name__}: {e}"
+        if not valid:
+            failures.append((name, message))
+    return failures
+
 class Validation:
     def __init__(self, product, website):
         self.product = product
         self.website = website
+        self.rules = RULESETS[website]
 
     def validate_sale_price(self):
         """Ensure that sale price is less than or equal to the original price."""
-        if self.website == "Foreign Fortune":
-            original_prices = self.product.get("prices", [])
-            sale_prices = self.product.get("sale_prices", [])
-            
-            if not sale_prices:
-                return True, "No sale price, skipping sale price validation."
-            if not original_prices:
-                return True, "No original prices, skipping sale price validation."
-            
-            for sale, original in zip(sale_prices, original_prices):
-                if sale > original:
-                    return False, f"Sale price {sale} is greater than the original price {original}."
-        # No sale price check for Trader Joe's and Le Chocolat
-        return True, "Sale price validation passed."
+        return self.rules['sale_price'](self.product)
 
     def validate_mandatory_fields(self):
         """Check that mandatory fields like title, title_id, and category are present."""
-        if self.website == "Le Chocolat":
-            mandatory_fields = ['title', 'title_id', 'price', 'category', 'weight']
-        elif self.website == "Trader Joe's":
-            mandatory_fields = ['title', 'price', 'category', 'ingredients']
-        else:  # Foreign Fortune
-            mandatory_fields = ['title', 'product_id', 'models', 'category']
-
-        for field in mandatory_fields:
-            if not self.product.get(field):
-                return False, f"Missing mandatory field: {field}"
-        return True, "Mandatory fields validation passed."
+        return self.rules['mandatory_fields'](self.product)
 
     def validate_variants(self):
         """Ensure that each product variant has images and prices (For Foreign Fortune)."""
-        if self.website == "Foreign Fortune":
-            models = self.product.get("models", [])
-            if not models:
-                return False, "No models found."
-            
-            for model in models:
-                for variant in model.get("variants", []):
-                    if not variant.get("image") or not variant.get("price"):
-                        return False, f"Variant missing image or price: {variant}"
-        return True, "Variant validation passed."
+        return self.rules['variants'](self.product)
 
     def validate_positive_price(self):
         """Check that all prices are positive numbers."""
-        if self.website == "Le Chocolat" or self.website == "Foreign Fortune":
-            price = self.product.get("price", None)
-            prices = self.product.get("prices", [])
-
-            # Handle if `price` is a single value
-            if price is not None and isinstance(price, (int, float)):
-                if price <= 0:
-                    return False, f"Invalid price: {price}. Price must be positive."
-
-            # Handle `prices` list if present
-            if prices:
-                for p in prices:
-                    if p <= 0:
-                        return False, f"Invalid price in list: {p}. Price must be positive."
-            elif price is None and not prices:
-                return False, "Prices are missing."
-
-        else:  # Trader Joe's - price is a string, needs parsing
-            price_str = self.product.get("price", "")
-            try:
-                price = float(price_str.replace("$", "").replace(",", "").strip())
-                if price <= 0:
-                    return False, f"Invalid price: {price}. Price must be positive."
-            except ValueError:
-                return False, "Price parsing failed."
-        
-        return True, "Price validation passed."
+        return self.rules['positive_price'](self.product)
 
     def validate_url(self):
         """Check that the product URL is valid."""
-        url = self.product.get("url", "")
-        if not re.match(r'https?://', url):
-            return False, f"Invalid URL: {url}"
-        return True, "URL validation passed."
+        return self.rules['url'](self.product)
 
     def validate_weight(self):
         """Ensure that the product has a valid weight (For Le Chocolat and Foreign Fortune)."""
-        if self.website == "Le Chocolat" or self.website == "Foreign Fortune":
-            weight = self.product.get("weight", None)
-            if weight is None or weight == 0:
-                return True, "No weight provided, skipping validation."
-            elif weight < 0:
-                return False, f"Invalid weight: {weight}. Weight must be positive."
-        return True, "Weight validation passed."
+        return self.rules['weight'](self.product)
+
+    def failures(self):
+        """Return (rule name, message) for every failing rule, not just the first."""
+        return failed_rules(self.product, self.rules)
 
     def run_all_validations(self):
-        """Run all validation methods and return the results."""
-        validations = [
-            self.validate_sale_price(),
-            self.validate_mandatory_fields(),
-            self.validate_variants(),
-            self.validate_positive_price(),
-            self.validate_url(),
-            self.validate_weight()
-        ]
-        
-        for validation, message in validations:
-            if not validation:
-                return False, message
+        """Run all validation methods and return the first failure, if any."""
+        failures = self.failures()
+        if failures:
+            return False, failures[0][1]
         return True, "All validations passed."
 
-def log_validation_results(products, log_file, summary_file, website_name):
-    """Log validation results for each product and count total pass and fail."""
-    total_pass = 0
-    total_fail = 0
+class ValidationReport:
+    """Validation results aggregated in memory: pass/fail totals and failure counts per rule for
+    each site, plus the first few failing records of every rule as samples."""
 
-    # Set up individual log file for each dataset
-    logger = setup_logger(log_file)
+    def __init__(self, sample_size=5):
+        self.sample_size = sample_size
+        self.sites = {}
 
-    # Log individual product results
-    for product in products:
-        validator = Validation(product, website_name)
-        is_valid, message = validator.run_all_validations()
-        if is_valid:
-            total_pass += 1
-        else:
-            total_fail += 1
-
-        logger.info(f"Product: {product.get('title', 'Unnamed')}")
-        logger.info(f"Product ID: {product.get('title_id', product.get('product_id', 'N/A'))}")
-        logger.info(f"Validation Status: {'Valid' if is_valid else 'Invalid'}")
-        logger.info(f"Message: {message}")
-        logger.info("-" * 50)
-
-    # Write summary log
+    def _site(self, website_name):
+        return self.sites.setdefault(website_name, {
+            'passed': 0, 'failed': 0, 'failures_by_rule': Counter(), 'samples': {}
+        })
+
+    def add(self, website_name, title, product_id, url, failures):
+        """Count one record's result; failing records are kept as samples while there is room."""
+        site = self._site(website_name)
+        if not failures:
+            site['passed'] += 1
+            return
+        site['failed'] += 1
+        for rule, message in failures:
+            site['failures_by_rule'][rule] += 1
+            samples = site['samples'].setdefault(rule, [])
+            if len(samples) < self.sample_size:
+                samples.append({'title': title, 'product_id': product_id, 'url': url, 'message': message})
+
+    def totals(self, website_name):
+        """Return (passed, failed) for a site."""
+        site = self._site(website_name)
+        return site['passed'], site['failed']
+
+    def to_dict(self):
+        """The machine-readable summary: per site totals, failures per rule and samples."""
+        return {
+            website_name: {
+                'passed': site['passed'],
+                'failed': site['failed'],
+                'failures_by_rule': dict(site['failures_by_rule'].most_common()),
+                'samples': site['samples'],
+            }
+            for website_name, site in self.sites.items()
+        }
+
+    def write_json(self, path):
+        """Write the summary as JSON."""
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(self.to_dict(), file, indent=4, ensure_ascii=False)
+
+def log_product_result(logger, title, product_id, failures):
+    """Log one product's result as a single line, listing every rule it failed."""
+    if failures:
+        messages = "; ".join(f"[{rule}] {message}" for rule, message in failures)
+        logger.info(f"Invalid | {title} | {product_id} | {messages}")
+    else:
+        logger.info(f"Valid | {title} | {product_id} | All validations passed.")
+
+def write_summary(summary_file, website_name, report):
+    """Append a site's pass/fail totals (and how often each rule failed) to the summary log."""
+    total_pass, total_fail = report.totals(website_name)
+    failures_by_rule = report.sites[website_name]['failures_by_rule']
     with open(summary_file, 'a') as summary_log:
         summary_log.write(f"{website_name} - Total Products Passed: {total_pass}\n")
-        summary_log.write(f"{website_name} - Total Products Failed: {total_fail}\n\n")
+        summary_log.write(f"{website_name} - Total Products Failed: {total_fail}\n")
+        if failures_by_rule:
+            counts = ", ".join(f"{rule}: {count}" for rule, count in failures_by_rule.most_common())
+            summary_log.write(f"{website_name} - Failures by rule: {counts}\n")
+        summary_log.write("\n")
+
+def _product_identity(product):
+    return (product.get('title', 'Unnamed'), product.get('title_id', product.get('product_id', 'N/A')),
+            product.get('url'))
+
+def log_validation_results(products, log_file, summary_file, website_name, report=None, detail=False):
+    """Validate products, aggregate the results and write the summary. A line per product goes
+    to `log_file` only with `detail`."""
+    report = report or ValidationReport()
+    rules = RULESETS[website_name]
+    logger = setup_logger(log_file) if detail else None
+
+    for product in products:
+        failures = failed_rules(product, rules)
+        title, product_id, url = _product_identity(product)
+        report.add(website_name, title, product_id, url, failures)
+        if logger:
+            log_product_result(logger, title, product_id, failures)
+
+    write_summary(summary_file, website_name, report)
+    print(f"Validation summary for {website_name} in {summary_file}" + (f", details in {log_file}" if detail else ""))
+    return report
+
+def iter_json_array(file_path, chunk_size=1 << 16):
+    """Yield the items of a JSON array file one at a time, reading it in chunks."""
+    decoder = json.JSONDecoder()
+    with open(file_path, 'r', encoding='utf-8') as file:
+        buffer, pos, started, eof = '', 0, False, False
+        while True:
+            # Skip the opening bracket, separators and whitespace between items
+            while pos < len(buffer) and (buffer[pos] in ' \t\r\n,' or (buffer[pos] == '[' and not started)):
+                started = started or buffer[pos] == '['
+                pos += 1
+            if pos < len(buffer) and buffer[pos] == ']':
+                return
+            if pos < len(buffer):
+                try:
+                    item, end = decoder.raw_decode(buffer, pos)
+                    yield item
+                    pos = end
+                    continue
+                except ValueError:
+                    if eof:
+                        raise
+            elif eof:
+                return
+            # The next item is cut off (or the buffer is used up): read another chunk
+            more = file.read(chunk_size)
+            eof = not more
+            buffer, pos = buffer[pos:] + more, 0
+
+def iter_jsonl_lines(file_path):
+    """Yield the non-empty lines of a JSONL(.gz) file. A gzip stream whose run crashed
+    before closing it ends at the last record that was flushed."""
+    opener = gzip.open if file_path.endswith('.gz') else open
+    with opener(file_path, 'rt', encoding='utf-8') as file:
+        try:
+            for line in file:
+                if line.strip():
+                    yield line
+        except (EOFError, gzip.BadGzipFile, zlib.error):
+            print(f"{file_path} ends where a crash cut it short")
+
+def iter_record_batches(file_path, batch_size):
+    """Yield lists of records from a JSONL(.gz) or JSON array file with bounded memory.
+    JSONL lines are passed on unparsed so the worker processes do the decoding."""
+    if file_path.endswith('.jsonl') or file_path.endswith('.jsonl.gz'):
+        records = iter_jsonl_lines(file_path)
+    else:
+        records = iter_json_array(file_path)
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def validate_batch(website_name, records):
+    """Validate a batch of records (JSON text or dicts) in a worker process.
+    Returns one (title, product id, url, failures) tuple per record."""
+    rules = RULESETS[website_name]
+    results = []
+    for record in records:
+        if isinstance(record, str):
+            try:
+                record = json.loads(record)
+            except ValueError as e:
+                results.append(("Unreadable record", "N/A", None, [('json', f"Record is not valid JSON: {e}")]))
+                continue
+        results.append(_product_identity(record) + (failed_rules(record, rules),))
+    return results
 
-    print(f"Validation results logged to {log_file} and summary in {summary_file}")
+def validate_file(file_path, log_file, summary_file, website_name, workers=None, batch_size=2000,
+                  report=None, detail=False):
+    """Stream a JSON or JSONL output file through the site's rules on a pool of processes.
+    At most two batches per worker are in flight, so memory stays bounded. Results are
+    aggregated into `report`; a line per product goes to `log_file` only with `detail`."""
+    workers = workers or os.cpu_count() or 1
+    report = report or ValidationReport()
+    logger = setup_logger(log_file) if detail else None
+
+    def add_results(results):
+        for title, product_id, url, failures in results:
+            report.add(website_name, title, product_id, url, failures)
+            if logger:
+                log_product_result(logger, title, product_id, failures)
+
+    batches = iter_record_batches(file_path, batch_size)
+    if workers == 1:
+        for batch in batches:
+            add_results(validate_batch(website_name, batch))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            pending = deque()
+            for batch in batches:
+                pending.append(executor.submit(validate_batch, website_name, batch))
+                if len(pending) >= workers * 2:
+                    add_results(pending.popleft().result())
+            while pending:
+                add_results(pending.popleft().result())
+
+    write_summary(summary_file, website_name, report)
+    print(f"Validation summary for {website_name} in {summary_file}" + (f", details in {log_file}" if detail else ""))
+    return report
 
 def validate_product_count(count_file, summary_file):
     """Validate product count from the count file."""
@@ -188,17 +441,33 @@ def load_products(file_path):
     with open(file_path, 'r') as file:
         return json.load(file)
 
+def product_source(stem):
+    """The output file to validate for a scraper: its JSONL stream if present, else the JSON export."""
+    for path in (f"{stem}.jsonl", f"{stem}.jsonl.gz"):
+        if os.path.exists(path):
+            return path
+    return f"{stem}.json"
+
 if __name__ == "__main__":
-    # Summary log file for all validations
+    # Ensure the output directory exists
+    os.makedirs("validation", exist_ok=True)
+
+    # Summary log file for all validations; pass --detail to also log a line per product
     summary_file = "validation/summary_validation.log"
+    detail = "--detail" in sys.argv
+    report = ValidationReport()
 
     # Validate Le Chocolat
-    lechocolat_products = load_products('output/lechocolat.json')
-    log_validation_results(lechocolat_products, 'validation/lechocolat_validation_log.log', summary_file, "Le Chocolat")
+    validate_file(product_source('output/lechocolat'), 'validation/lechocolat_validation_log.log', summary_file, "Le Chocolat",
+                  report=report, detail=detail)
 
     # Validate Foreign Fortune
-    foreignfortune_products = load_products('output/foreignfortune.json')
-    log_validation_results(foreignfortune_products, 'validation/foreignfortune_validation_log.log', summary_file, "Foreign Fortune")
+    validate_file(product_source('output/foreignfortune'), 'validation/foreignfortune_validation_log.log', summary_file, "Foreign Fortune",
+                  report=report, detail=detail)
+
+    # Machine-readable summary: counts per rule per site and samples of failing records
+    report.write_json("validation/summary_validation.json")
+    close_loggers()
 
     # Validate Trader Joe's count
     validate_product_count('output/traderjoes_count.txt', summary_file)
@@ -0,0 +1,56 @@
+from collections import Counter
+from metrics import METRICS
+from validation import RULESETS, ValidationReport, failed_rules
+
+
+# The site's validation rules (validation.RULESETS) run on every record as it is scraped, while
+# the browser is still on the site. A record that fails is fetched again, up to `max_refetches`
+# times, bypassing whatever produced it (cache entry, carried-forward record, API item); one that
+# still fails is written as it is and counted, so the offline pass in validation.py only confirms.
+class ValidationStage:
+    def __init__(self, website_name, max_refetches=2, sample_size=5):
+        self.website_name = website_name
+        self.rules = RULESETS[website_name]
+        self.max_refetches = max_refetches
+        self.refetches = {}  # url -> re-fetches done so far (only urls that failed at least once)
+        self.results = ValidationReport(sample_size=sample_size)
+        self.stats = Counter()
+
+    # Number of times the record for `url` has been sent back for a re-fetch; scrapers use it to
+    # take a more direct path on a re-fetch
+    def refetching(self, url):
+        return self.refetches.get(url, 0)
+
+    # Validate a freshly scraped record; True when it should be fetched again. A missing record
+    # means the scrape itself failed (and was retried there), so there is nothing to validate.
+    def needs_refetch(self, url, record):
+        if not record:
+            self.refetches.pop(url, None)
+            return False
+        failures = failed_rules(record, self.rules)
+        attempts = self.refetches.get(url, 0)
+        if not failures:
+            self.stats['recovered' if attempts else 'passed'] += 1
+            self.refetches.pop(url, None)
+            return False
+        if attempts < self.max_refetches:
+            self.refetches[url] = attempts + 1
+            self.stats['refetched'] += 1
+            METRICS.count('refetches', rule=failures[0][0])
+            print(f"Re-fetching {url} ({attempts + 1} of {self.max_refetches}): "
+                  + "; ".join(f"[{rule}] {message}" for rule, message in failures))
+            return True
+        self.stats['still_failing'] += 1
+        self.refetches.pop(url, None)
+        self.results.add(self.website_name, record.get('title', 'Unnamed'),
+                         record.get('title_id', record.get('product_id', 'N/A')), url, failures)
+        return False
+
+    def report(self):
+        site = self.results.to_dict().get(self.website_name, {})
+        return {
+            'site': self.website_name,
+            **dict(self.stats),
+            'failures_by_rule': site.get('failures_by_rule', {}),
+            'samples': site.get('samples', {}),
+        }